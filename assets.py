@@ -0,0 +1,121 @@
+import gzip
+import os
+import re
+from hashlib import sha256
+from mimetypes import guess_type
+from tempfile import NamedTemporaryFile
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+from caching import etag_matches
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json")
+PRECOMPRESSED = (".gz", ".br")
+MIN_SIZE = 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.\w+$")
+
+
+def compressors() -> dict:
+    encoders = {"gzip": (".gz", lambda data: gzip.compress(data, 9, mtime=0))}
+    if brotli is not None:
+        encoders = {"br": (".br", lambda data: brotli.compress(data, quality=11)), **encoders}
+    return encoders
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    encodings = set()
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if not params or float(quality) > 0:
+                encodings.add(encoding.strip().lower())
+        except ValueError:
+            continue
+    return encodings
+
+
+def precompress(directory: str) -> int:
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) < MIN_SIZE:
+                continue
+            with open(path, "rb") as file:
+                data = None
+                for suffix, compress in compressors().values():
+                    target = path + suffix
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    data = data if data is not None else file.read()
+                    compressed = compress(data)
+                    if len(compressed) >= len(data):
+                        continue
+                    with NamedTemporaryFile(dir=root, delete=False) as tmp:
+                        tmp.write(compressed)
+                    os.replace(tmp.name, target)
+                    written += 1
+    return written
+
+
+class AssetFiles(StaticFiles):
+    def __init__(self, *, directory: str, source_maps: bool = False):
+        super().__init__(directory=directory)
+        self.source_maps = source_maps
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if path.endswith(PRECOMPRESSED) or path.endswith(".map") and not self.source_maps:
+            raise HTTPException(status_code=404)
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response = None
+        for encoding, (suffix, _) in compressors().items():
+            if encoding in accepted and path.endswith(COMPRESSIBLE):
+                try:
+                    response = await super().get_response(path + suffix, scope)
+                except HTTPException:
+                    continue
+                response.headers["content-encoding"] = encoding
+                response.headers["content-type"] = guess_type(path)[0] or "application/octet-stream"
+                break
+        if response is None:
+            response = await super().get_response(path, scope)
+        if path.endswith(COMPRESSIBLE):
+            response.headers["vary"] = "Accept-Encoding"
+        response.headers["cache-control"] = IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE
+        return response
+
+
+class Page:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.body = file.read()
+        self.media_type = guess_type(path)[0] or "text/html"
+        self.etag = f'W/"{sha256(self.body).hexdigest()[:16]}"'
+        self.encoded = {
+            encoding: compressed
+            for encoding, (_, compress) in compressors().items()
+            if len(compressed := compress(self.body)) < len(self.body)
+        }
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding, body in self.encoded.items():
+            if encoding in accepted:
+                return Response(body, media_type=self.media_type, headers={**headers, "Content-Encoding": encoding})
+        return Response(self.body, media_type=self.media_type, headers=headers)
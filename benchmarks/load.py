@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter
+from dotenv import find_dotenv, load_dotenv
+load_dotenv(find_dotenv())
+
+from httpx import AsyncClient, ASGITransport
+from benchmarks.seed import API_KEY_PREFIX
+
+IMAGE = Path(__file__).resolve().parent.parent / "33584.jpg"
+
+
+class Scenario:
+    def __init__(self, name: str, method: str, route: str, request):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.request = request
+
+
+def scenarios(users: int, tweets: int, requests: int, image_id: int) -> list[Scenario]:
+    def user():
+        return random.randint(1, users)
+
+    follows = [(user(), user()) for _ in range(requests)]
+    likes = [(user(), random.randint(1, tweets)) for _ in range(requests)]
+    posted = []
+
+    def headers(user_id: int) -> dict:
+        return {"api-key": f"{API_KEY_PREFIX}{user_id}"}
+
+    async def post_tweet(http: AsyncClient, i: int):
+        user_id = user()
+        response = await http.post(
+            "/api/tweets", json={"tweet_data": "benchmark", "tweet_media_ids": []}, headers=headers(user_id)
+        )
+        posted.append((user_id, response.json()["tweet_id"]))
+        return response
+
+    return [
+        Scenario("me", "GET", "/api/users/me", lambda http, i: http.get("/api/users/me", headers=headers(user()))),
+        Scenario(
+            "profile", "GET", "/api/users/{id}",
+            lambda http, i: http.get(f"/api/users/{user()}", headers=headers(user())),
+        ),
+        Scenario(
+            "feed", "GET", "/api/tweets",
+            lambda http, i: http.get("/api/tweets", params={"limit": 20}, headers=headers(user())),
+        ),
+        Scenario(
+            "follow", "POST", "/api/users/{id}/follow",
+            lambda http, i: http.post(f"/api/users/{follows[i][1]}/follow", headers=headers(follows[i][0])),
+        ),
+        Scenario(
+            "unfollow", "DELETE", "/api/users/{id}/follow",
+            lambda http, i: http.delete(f"/api/users/{follows[i][1]}/follow", headers=headers(follows[i][0])),
+        ),
+        Scenario(
+            "like", "POST", "/api/tweets/{id}/likes",
+            lambda http, i: http.post(f"/api/tweets/{likes[i][1]}/likes", headers=headers(likes[i][0])),
+        ),
+        Scenario(
+            "unlike", "DELETE", "/api/tweets/{id}/likes",
+            lambda http, i: http.delete(f"/api/tweets/{likes[i][1]}/likes", headers=headers(likes[i][0])),
+        ),
+        Scenario("post_tweet", "POST", "/api/tweets", post_tweet),
+        Scenario(
+            "delete_tweet", "DELETE", "/api/tweets/{id}",
+            lambda http, i: http.delete(f"/api/tweets/{posted[i][1]}", headers=headers(posted[i][0])),
+        ),
+        Scenario("media", "GET", "/{media_id}", lambda http, i: http.get(f"/{image_id}")),
+    ]
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    return {
+        sample: float(value)
+        for sample, value in (line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+    }
+
+
+async def sql_totals(http: AsyncClient, scenario: Scenario) -> tuple[float, float]:
+    samples = parse_metrics((await http.get("/metrics")).text)
+    labels = f'{{method="{scenario.method}",route="{scenario.route}"}}'
+    return (
+        samples.get(f"http_request_sql_statements_sum{labels}", 0),
+        samples.get(f"http_request_sql_statements_count{labels}", 0),
+    )
+
+
+async def run(http: AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    pending = iter(range(requests))
+    statements, counted = await sql_totals(http, scenario)
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            started = perf_counter()
+            response = await scenario.request(http, i)
+            latencies.append(perf_counter() - started)
+            errors += response.status_code >= 400
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - started
+    statements_after, counted_after = await sql_totals(http, scenario)
+
+    percentiles = quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "sql_per_request": (statements_after - statements) / max(counted_after - counted, 1),
+    }
+
+
+async def seed_memory(users: int, tweets: int):
+    from database.models import Tweet
+    from repository import memory_repository
+    for i in range(1, users + 1):
+        await memory_repository.add_user(f"{API_KEY_PREFIX}{i}")
+    for i in range(tweets):
+        tweet = Tweet.TweetSchema(tweet_data=f"tweet {i}", tweet_media_ids=[])
+        await memory_repository.load_tweet(random.randint(1, users), tweet)
+
+
+@asynccontextmanager
+async def client(args: argparse.Namespace):
+    if args.url:
+        async with AsyncClient(base_url=args.url, timeout=60) as http:
+            yield http
+        return
+    import config
+    from routers import app
+    if config.REPOSITORY_BACKEND == "memory":
+        await seed_memory(args.users, args.tweets)
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://benchmark", timeout=60) as http:
+            yield http
+
+
+def report(results: dict, baseline: dict | None, tolerance: float) -> bool:
+    columns = ("rps", "p50_ms", "p95_ms", "p99_ms", "sql_per_request")
+    print(f"{'scenario':<14}{'errors':>8}" + "".join(f"{column:>18}" for column in columns))
+    regressed = False
+    for name, result in results.items():
+        cells = []
+        for column in columns:
+            cell = f"{result[column]:.2f}"
+            if baseline and name in baseline:
+                before = baseline[name][column]
+                change = (result[column] - before) / before * 100 if before else 0
+                worse = change < -tolerance if column == "rps" else change > tolerance
+                regressed |= worse
+                cell += f" ({change:+.0f}%{'!' if worse else ''})"
+            cells.append(f"{cell:>18}")
+        print(f"{name:<14}{result['errors']:>8}" + "".join(cells))
+    return regressed
+
+
+async def main(args: argparse.Namespace):
+    random.seed(args.seed)
+    results = {}
+    async with client(args) as http:
+        with open(IMAGE, "rb") as file:
+            image = await http.post("/api/medias", files={"file": file}, headers={"api-key": f"{API_KEY_PREFIX}1"})
+        selected = [
+            scenario
+            for scenario in scenarios(args.users, args.tweets, args.requests, image.json()["media_id"])
+            if not args.scenario or scenario.name in args.scenario
+        ]
+        if any(scenario.name == "delete_tweet" for scenario in selected) and not any(
+            scenario.name == "post_tweet" for scenario in selected
+        ):
+            sys.exit("delete_tweet removes the tweets created by post_tweet, run them together")
+        await asyncio.gather(
+            *(http.get("/api/users/me", headers={"api-key": f"{API_KEY_PREFIX}1"}) for _ in range(args.concurrency))
+        )
+        for scenario in selected:
+            results[scenario.name] = await run(http, scenario, args.requests, args.concurrency)
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    regressed = report(results, baseline, args.tolerance)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load every route and report latency percentiles.")
+    parser.add_argument("--url", help="running server; by default the app is served in-process")
+    parser.add_argument("--users", type=int, default=10000, help="users created by benchmarks.seed")
+    parser.add_argument("--tweets", type=int, default=100000, help="tweets created by benchmarks.seed")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--scenario", action="append", help="run only these scenarios")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for reproducible request mixes")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=20, help="allowed regression, percent")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import os
+from statistics import median
+from time import perf_counter
+from dotenv import find_dotenv, load_dotenv
+load_dotenv(find_dotenv())
+
+from sqlalchemy import make_url, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from database.engine import run_migrations
+from database.queries import Search
+from benchmarks.seed import analyze
+
+NEEDLES = 100
+VOCABULARY = 5000
+
+
+async def grow(bind, rows: int, target: int):
+    async with bind.begin() as conn:
+        await conn.execute(
+            text(
+                f"""INSERT INTO tweet (user_id, content, attachments)
+                    SELECT 1, (
+                        SELECT string_agg('word' || floor(random() * {VOCABULARY})::int, ' ')
+                        FROM generate_series(1, 8) WHERE i > 0
+                    ), '{{}}'
+                    FROM generate_series(1, {target - rows}) AS i"""
+            )
+        )
+    await analyze(bind)
+
+
+async def measure(bind, q: str, rounds: int, page: int = 1) -> float:
+    timings = []
+    async with async_sessionmaker(bind)() as session:
+        for _ in range(rounds + 1):
+            started, cursor = perf_counter(), None
+            for _ in range(page):
+                cursor = (await Search.search_tweets(session, q, cursor=cursor))["next_cursor"]
+            timings.append(perf_counter() - started)
+    return median(timings[1:]) * 1000
+
+
+async def main(args: argparse.Namespace):
+    url = make_url(os.getenv("BASE"))
+    database = f"{url.database}_search"
+    admin = create_async_engine(url, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    bench = create_async_engine(url.set(database=database))
+    async with admin.connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+        await conn.execute(text(f'CREATE DATABASE "{database}"'))
+    try:
+        await run_migrations(bench)
+        async with bench.begin() as conn:
+            await conn.execute(text("""INSERT INTO "user" (name, api_key) VALUES ('bench', 'search-bench')"""))
+            await conn.execute(
+                text(
+                    f"""INSERT INTO tweet (user_id, content, attachments)
+                        SELECT 1, 'needle ' || repeat('word0 ', i % 3), '{{}}' FROM generate_series(1, {NEEDLES}) AS i"""
+                )
+            )
+
+        print(f"{'rows':>10} {'needle ms':>10} {'page 3 ms':>10} {'common ms':>10}")
+        rows = NEEDLES
+        for target in sorted(args.sizes):
+            started = perf_counter()
+            await grow(bench, rows, target)
+            rows = target
+            needle = await measure(bench, "needle", args.rounds)
+            deep = await measure(bench, "needle", args.rounds, page=3)
+            common = await measure(bench, "word1", args.rounds)
+            print(
+                f"{rows:>10} {needle:>10.2f} {deep:>10.2f} {common:>10.2f}"
+                f"   (filled in {perf_counter() - started:.0f}s)"
+            )
+    finally:
+        await bench.dispose()
+        if not args.keep:
+            async with admin.connect() as conn:
+                await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+        await admin.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search latency while the tweet table grows, in a separate <database>_search database."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10_000, 100_000, 1_000_000, 10_000_000],
+        help="comma separated table sizes",
+    )
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database")
+    asyncio.run(main(parser.parse_args()))
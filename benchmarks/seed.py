@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+from time import perf_counter
+from dotenv import find_dotenv, load_dotenv
+load_dotenv(find_dotenv())
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, async_sessionmaker
+from database.engine import engine, run_migrations
+from database.queries import rebuild_timelines, repair_counters
+
+API_KEY_PREFIX = "bench-"
+
+
+def seed_statements(users: int, tweets: int, follows: int, likes: int, alpha: float) -> tuple[str, ...]:
+    return (
+        f"""INSERT INTO "user" (name, api_key)
+            SELECT 'user ' || i, '{API_KEY_PREFIX}' || i FROM generate_series(1, {users}) AS i""",
+        f"""INSERT INTO tweet (user_id, content, attachments)
+            SELECT 1 + floor(random() * {users})::int, 'tweet ' || i, '{{}}'
+            FROM generate_series(1, {tweets}) AS i""",
+        f"""INSERT INTO follow (follower_id, followee_id)
+            SELECT 1 + floor(random() * {users})::int, 1 + floor(power(random(), {alpha}) * {users})::int
+            FROM generate_series(1, {follows}) ON CONFLICT DO NOTHING""",
+        f"""INSERT INTO tweet_like (tweet_id, user_id)
+            SELECT 1 + floor(power(random(), {alpha}) * {tweets})::int, 1 + floor(random() * {users})::int
+            FROM generate_series(1, {likes}) ON CONFLICT DO NOTHING""",
+    )
+
+
+async def seed(conn: AsyncConnection, users: int, tweets: int, follows: int, likes: int, alpha: float):
+    for statement in seed_statements(users, tweets, follows, likes, alpha):
+        await conn.execute(text(statement))
+
+
+async def reset(conn: AsyncConnection):
+    await conn.execute(text('TRUNCATE "user", tweet, image RESTART IDENTITY CASCADE'))
+
+
+async def analyze(bind: AsyncEngine):
+    async with bind.connect() as conn:
+        await (await conn.execution_options(isolation_level="AUTOCOMMIT")).execute(text("ANALYZE"))
+
+
+async def main(args: argparse.Namespace):
+    started = perf_counter()
+    await run_migrations()
+    async with engine.begin() as conn:
+        await reset(conn)
+        await seed(conn, args.users, args.tweets, args.follows, args.likes, args.alpha)
+    async with async_sessionmaker(engine)() as session:
+        await repair_counters(session)
+        await rebuild_timelines(session)
+    await analyze(engine)
+    await engine.dispose()
+    print(
+        f"Seeded {args.users} users, {args.tweets} tweets, {args.follows} follows, {args.likes} likes "
+        f"in {perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the database from BASE with a synthetic social graph.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tweets", type=int, default=100000)
+    parser.add_argument("--follows", type=int, default=200000, help="follow edges to generate")
+    parser.add_argument("--likes", type=int, default=300000, help="likes to generate")
+    parser.add_argument(
+        "--alpha", type=float, default=3.0, help="skew of followees and liked tweets, 1 is uniform"
+    )
+    asyncio.run(main(parser.parse_args()))
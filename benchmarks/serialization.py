@@ -0,0 +1,58 @@
+import asyncio
+from time import perf_counter
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from models import TapeModel
+from serialization import _stream_tape
+
+TWEETS = 1000
+ROUNDS = 50
+
+
+def tape(size: int) -> dict:
+    return {
+        "result": True,
+        "tweets": [
+            {
+                "id": i,
+                "content": f"tweet number {i} " * 8,
+                "attachments": [i, i + 1],
+                "author": {"id": i % 100, "name": f"user {i % 100}"},
+                "likes": [{"user_id": user_id, "name": f"user {user_id}"} for user_id in range(i % 7)],
+            }
+            for i in range(size)
+        ],
+        "next_cursor": "MTIzNA",
+    }
+
+
+async def default(payload: dict) -> bytes:
+    field = create_response_field(name="Response_get_tweets", type_=TapeModel)
+    content = await serialize_response(field=field, response_content=payload)
+    return JSONResponse(content).body
+
+
+async def fast(payload: dict) -> bytes:
+    return ORJSONResponse(payload).body
+
+
+async def streamed(payload: dict) -> bytes:
+    return b"".join([chunk async for chunk in _stream_tape(payload)])
+
+
+async def main():
+    payload = tape(TWEETS)
+    print(f"{'path':>10} {'ms / 1k tweets':>16}")
+    for name, serialize in (("default", default), ("orjson", fast), ("streamed", streamed)):
+        await serialize(payload)
+        started = perf_counter()
+        for _ in range(ROUNDS):
+            await serialize(payload)
+        elapsed = (perf_counter() - started) / ROUNDS * 1000 * 1000 / TWEETS
+        print(f"{name:>10} {elapsed:>16.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
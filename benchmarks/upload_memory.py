@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+import tracemalloc
+from starlette.requests import Request
+from media.storage import LocalMediaStore, MediaStore
+from media.uploads import receive_upload
+
+CHUNK_SIZE = 64 * 1024
+SIZES_MB = (1, 10, 100)
+PREFIX = (
+    b"--benchmark\r\n"
+    b'Content-Disposition: form-data; name="file"; filename="upload.bin"\r\n'
+    b"Content-Type: application/octet-stream\r\n\r\n"
+)
+SUFFIX = b"\r\n--benchmark--\r\n"
+
+
+def multipart_request(size: int) -> Request:
+    chunk = os.urandom(CHUNK_SIZE)
+
+    async def body():
+        yield PREFIX
+        for offset in range(0, size, CHUNK_SIZE):
+            yield chunk[:min(CHUNK_SIZE, size - offset)]
+        yield SUFFIX
+
+    messages = body()
+
+    async def receive():
+        try:
+            return {"type": "http.request", "body": await anext(messages), "more_body": True}
+        except StopAsyncIteration:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+    headers = [
+        (b"content-type", b"multipart/form-data; boundary=benchmark"),
+        (b"content-length", str(len(PREFIX) + size + len(SUFFIX)).encode()),
+    ]
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+async def streaming(request: Request, store: MediaStore):
+    await receive_upload(request, store, max_size=1 << 40)
+
+
+async def buffered(request: Request, store: MediaStore):
+    image = (await request.form()).get("file")
+    await store.save(await image.read())
+
+
+async def peak_memory(upload, size: int, store: MediaStore) -> int:
+    request = multipart_request(size)
+    tracemalloc.start()
+    try:
+        await upload(request, store)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as root:
+        store = LocalMediaStore(root)
+        print(f"{'upload':>8} {'streaming':>12} {'buffered':>12}")
+        for size_mb in SIZES_MB:
+            size = size_mb * 1024 * 1024
+            streamed = await peak_memory(streaming, size, store)
+            buffered_ = await peak_memory(buffered, size, store)
+            print(f"{size_mb:>6}MB {streamed / 1024:>10.0f}KB {buffered_ / 1024:>10.0f}KB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
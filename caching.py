@@ -0,0 +1,75 @@
+from collections import OrderedDict, defaultdict
+from secrets import token_hex
+import config
+
+
+class Versions:
+    def __init__(self):
+        self.generation = token_hex(4)
+        self.epoch = 0
+        self._users: defaultdict[int, int] = defaultdict(int)
+
+    def bump(self, *user_ids: int):
+        for user_id in user_ids:
+            self._users[user_id] += 1
+
+    def bump_all(self):
+        self.epoch += 1
+
+    def tweets_changed(self):
+        self.bump_all()
+
+    def follows_changed(self, user_id: int, follower_id: int):
+        self.bump(user_id, follower_id)
+        if config.FEED_MODE == "pull":
+            self.bump_all()
+
+    def feed_etag(self, user_id: int) -> str:
+        return f'W/"{self.generation}.{self.epoch}.{self._users.get(user_id, 0)}"'
+
+    def profile_etag(self, user_id: int) -> str:
+        return f'W/"{self.generation}.{self._users.get(user_id, 0)}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._responses: OrderedDict[tuple, dict] = OrderedDict()
+
+    def get(self, key: tuple) -> dict | None:
+        if self.maxsize <= 0:
+            return None
+        cached = self._responses.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self._responses.move_to_end(key)
+        self.hits += 1
+        return cached
+
+    def set(self, key: tuple, payload: dict):
+        if self.maxsize <= 0:
+            return
+        self._responses[key] = payload
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.maxsize:
+            self._responses.popitem(last=False)
+
+    def __len__(self):
+        return len(self._responses)
+
+    def clear(self):
+        self._responses.clear()
+
+
+versions = Versions()
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE)
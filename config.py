@@ -0,0 +1,59 @@
+import os
+
+FEED_MODE = os.getenv("FEED_MODE", "pull")
+REPOSITORY_BACKEND = os.getenv("REPOSITORY_BACKEND", "sql")
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 300))
+
+MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "local")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media_files")
+
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 * 1024))
+
+MEDIA_VARIANT_SIZES = tuple(int(size) for size in os.getenv("MEDIA_VARIANT_SIZES", "256,1024").split(","))
+MEDIA_VARIANT_FORMAT = os.getenv("MEDIA_VARIANT_FORMAT", "webp")
+MEDIA_VARIANT_QUALITY = int(os.getenv("MEDIA_VARIANT_QUALITY", 80))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", os.cpu_count() or 1))
+
+LIKE_BUFFER = os.getenv("LIKE_BUFFER", "0") == "1"
+LIKE_FLUSH_INTERVAL = int(os.getenv("LIKE_FLUSH_INTERVAL", 50))
+LIKE_FLUSH_SIZE = int(os.getenv("LIKE_FLUSH_SIZE", 500))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+
+SENTRY_DSN = os.getenv("SENTRY_DSN", "")
+SENTRY_SAMPLE_RATE = float(os.getenv("SENTRY_SAMPLE_RATE", 1.0))
+SENTRY_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", 0.0))
+SENTRY_PROFILES_SAMPLE_RATE = float(os.getenv("SENTRY_PROFILES_SAMPLE_RATE", 0.0))
+SENTRY_ROUTE_SAMPLE_RATES = {
+    route: float(rate)
+    for route, rate in (
+        rule.rsplit("=", 1) for rule in os.getenv("SENTRY_ROUTE_SAMPLE_RATES", "").split(",") if rule
+    )
+}
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 30))
+
+CONDITIONAL_GET = os.getenv("CONDITIONAL_GET", "0") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 0))
+
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+JSON_STREAM_THRESHOLD = int(os.getenv("JSON_STREAM_THRESHOLD", 1000))
+
+STATIC_PRECOMPRESS = os.getenv("STATIC_PRECOMPRESS", "1") == "1"
+STATIC_SOURCE_MAPS = os.getenv("STATIC_SOURCE_MAPS", "0") == "1"
+
+WORKERS = int(os.getenv("WORKERS", 1))
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "auto")
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "auto")
+DB_WAIT_TIMEOUT = float(os.getenv("DB_WAIT_TIMEOUT", 60))
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+PROFILE_PAGE_SIZE = int(os.getenv("PROFILE_PAGE_SIZE", 100))
@@ -1,16 +1,130 @@
+import asyncio
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from time import monotonic, perf_counter
+from uuid import uuid4
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Connection, event, inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import config
 from database.models import Base
 
-engine = create_async_engine(os.getenv("BASE"))
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "wait_seconds": self.wait_seconds,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+def _connect_args() -> dict:
+    connect_args = {
+        "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+    }
+    if not config.DB_STATEMENT_CACHE_SIZE:
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    return connect_args
+
+
+engine = create_async_engine(
+    os.getenv("BASE", "postgresql+asyncpg://"),
+    poolclass=InstrumentedPool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
 session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
 
 
-async def create_all():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+@dataclass
+class QueryStats:
+    statements: int = 0
+    seconds: float = 0.0
+
+
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    stats = query_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.seconds += perf_counter() - context.query_started
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+BASELINE_REVISION = "0001"
 
 
 async def drop_all():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
+
+
+def _upgrade(connection: Connection, revision: str):
+    alembic_config = Config(ALEMBIC_INI)
+    alembic_config.set_main_option("script_location", str(ALEMBIC_INI.parent / "migrations"))
+    alembic_config.attributes["connection"] = connection
+    tables = inspect(connection)
+    if not tables.has_table("alembic_version") and tables.has_table("user"):
+        command.stamp(alembic_config, BASELINE_REVISION)
+    command.upgrade(alembic_config, revision)
+
+
+async def run_migrations(bind: AsyncEngine = engine, revision: str = "head"):
+    async with bind.begin() as conn:
+        await conn.run_sync(_upgrade, revision)
+
+
+async def ping(bind: AsyncEngine = engine):
+    async with bind.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def wait_for_database(timeout: float, bind: AsyncEngine = engine) -> int:
+    deadline, delay, attempts = monotonic() + timeout, 0.1, 1
+    while True:
+        try:
+            await ping(bind)
+            return attempts
+        except (OSError, DBAPIError):
+            if monotonic() + delay > deadline:
+                raise
+        await asyncio.sleep(delay)
+        delay, attempts = min(delay * 2, 5), attempts + 1
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from itertools import chain
+from time import perf_counter
+import config
+from caching import versions
+from repository import open_repository
+
+logger = logging.getLogger(__name__)
+
+
+class LikeBuffer:
+    def __init__(self, interval: float, size: int):
+        self.interval = interval
+        self.size = size
+        self._pending: dict[tuple[int, int], bool] = {}
+        self._flushing: dict[tuple[int, int], bool] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self.flushes = 0
+        self.failures = 0
+        self.flushed = 0
+        self.flush_seconds = 0.0
+        self.last_flush_size = 0
+        self.last_flush_seconds = 0.0
+
+    def add(self, tweet_id: int, user_id: int, liked: bool):
+        self._pending[tweet_id, user_id] = liked
+        if len(self._pending) >= self.size:
+            self._wakeup.set()
+
+    def pending(self, user_id: int) -> bool:
+        return any(pending_user_id == user_id for _, pending_user_id in chain(self._pending, self._flushing))
+
+    async def sync(self, user_id: int):
+        if self.pending(user_id):
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            changes, self._pending = self._pending, {}
+            if not changes:
+                return
+            self._flushing, started = changes, perf_counter()
+            try:
+                async with open_repository() as repository:
+                    await repository.apply_likes(changes)
+            except Exception:
+                logger.exception("Failed to flush %s buffered likes, retrying", len(changes))
+                self.failures += 1
+                self._pending = {**changes, **self._pending}
+                return
+            finally:
+                self._flushing = {}
+            versions.tweets_changed()
+            self.last_flush_size = len(changes)
+            self.last_flush_seconds = perf_counter() - started
+            self.flushes += 1
+            self.flushed += self.last_flush_size
+            self.flush_seconds += self.last_flush_seconds
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        self._stopping = False
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+like_buffer = LikeBuffer(config.LIKE_FLUSH_INTERVAL, config.LIKE_FLUSH_SIZE)
@@ -1,32 +1,37 @@
 from typing import List
 from pydantic import BaseModel
-from sqlalchemy import Table, Integer, ForeignKey, Column, String, ARRAY, LargeBinary
+from sqlalchemy import (
+    Table, Integer, ForeignKey, Column, String, ARRAY, LargeBinary, Index, Computed, text
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, relationship
 
 
 class Base(DeclarativeBase): ...
 
 
-subscription = Table(
-    "subscription",
+follows = Table(
+    "follow",
     Base.metadata,
-    Column("user_id", Integer, ForeignKey("user.id"), primary_key=True),
-    Column("subscription_id", Integer, ForeignKey("user.id"), primary_key=True),
+    Column("follower_id", Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True),
+    Column("followee_id", Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_follow_followee_id_follower_id", "followee_id", "follower_id"),
 )
 
-
-follower = Table(
-    "follower",
+timeline = Table(
+    "timeline",
     Base.metadata,
-    Column("user_id", Integer, ForeignKey("user.id"), primary_key=True),
-    Column("follower_id", Integer, ForeignKey("user.id"), primary_key=True),
+    Column("user_id", Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True),
+    Column("tweet_id", Integer, ForeignKey("tweet.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_timeline_tweet_id", "tweet_id"),
 )
 
 tweet_like = Table(
     "tweet_like",
     Base.metadata,
-    Column('tweet_id', Integer, ForeignKey("tweet.id"), primary_key=True),
-    Column('user_id', Integer, ForeignKey("user.id"), primary_key=True)
+    Column('tweet_id', Integer, ForeignKey("tweet.id", ondelete="CASCADE"), primary_key=True),
+    Column('user_id', Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_tweet_like_user_id_tweet_id", "user_id", "tweet_id"),
 )
 
 
@@ -36,10 +41,16 @@ class Tweet(Base):
         tweet_media_ids: List[int | None]
 
     __tablename__ = "tweet"
+    __table_args__ = (
+        Index("ix_tweet_user_id_id", "user_id", text("id DESC")),
+        Index("ix_tweet_search", "search", postgresql_using="gin"),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
     content = Column(String(300))
     attachments = Column(ARRAY(Integer))
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    search = Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(content, ''))", persisted=True))
 
     author = relationship(
         "User",
@@ -58,18 +69,22 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, default="User")
     api_key = Column(String, unique=True, nullable=False)
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
     subscriptions = relationship(
         "User",
-        secondary="subscription",
-        primaryjoin=id == subscription.c.subscription_id,
-        secondaryjoin=id == subscription.c.user_id,
+        secondary=follows,
+        primaryjoin=id == follows.c.follower_id,
+        secondaryjoin=id == follows.c.followee_id,
+        viewonly=True,
     )
 
     followers = relationship(
         "User",
-        secondary=follower,
-        primaryjoin=id == follower.c.follower_id,
-        secondaryjoin=id == follower.c.user_id,
+        secondary=follows,
+        primaryjoin=id == follows.c.followee_id,
+        secondaryjoin=id == follows.c.follower_id,
+        viewonly=True,
     )
 
     tweets = relationship(
@@ -88,4 +103,7 @@ class User(Base):
 class Image(Base):
     __tablename__ = "image"
     id = Column(Integer, primary_key=True)
-    image = Column(LargeBinary, nullable=False)
+    image = Column(LargeBinary)
+    sha256 = Column(String(64), index=True)
+    size = Column(Integer)
+    mime_type = Column(String)
@@ -1,248 +1,663 @@
-from sqlalchemy import select, insert, Result, desc
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import Sequence
+from sqlalchemy import (
+    select, insert, update, delete, union, union_all, Result, Row,
+    desc, func, case, any_, all_, or_, true, literal, column, cast, tuple_, Integer, Boolean, ARRAY,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from database.models import User, Tweet, Image
+import config
+from media import media_store
+from media.mime import sniff_mime_type
+from database.models import User, Tweet, Image, follows, tweet_like, timeline
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(key: tuple[int, ...]) -> str:
+    return urlsafe_b64encode(".".join(map(str, key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> tuple[int, ...]:
+    try:
+        key = tuple(map(int, urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(".")))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+    if len(key) != size:
+        raise InvalidCursor("Invalid cursor")
+    return key
 
 
 class UserApiFormatMixin:
     @staticmethod
-    async def _build_user_as_api_format(user: User):
+    async def _build_user_as_api_format(user: Row, followers: dict, following: dict):
         return {
             "result": True,
             "user": {
                 "id": user.id,
                 "name": user.name,
-                "followers": [
-                    {"id": follower.id, "name": follower.name}
-                    for follower in user.followers
-                ],
-                "following": [
-                    {"id": subscribe.id, "name": subscribe.name}
-                    for subscribe in user.subscriptions
-                ],
+                "followers": followers["users"],
+                "following": following["users"],
+                "followers_count": user.followers_count,
+                "following_count": user.following_count,
+                "followers_next_cursor": followers["next_cursor"],
+                "following_next_cursor": following["next_cursor"],
             }
         }
 
 
 class TweetApiFormatMixin:
     @staticmethod
-    async def _build_tweet_as_api_format(session: AsyncSession, tweet: Tweet):
-        tweet = (
-            await session.execute(
-                select(Tweet)
-                .where(Tweet.id == tweet.id)
-                .options(selectinload(Tweet.users_likes), selectinload(Tweet.author))
+    async def _build_tweets_as_api_format(session: AsyncSession, tweets: Sequence[Row]):
+        likes = {tweet.id: [] for tweet in tweets}
+        if likes:
+            users_likes = await session.execute(
+                select(tweet_like.c.tweet_id, User.id, User.name)
+                .join(User, User.id == tweet_like.c.user_id)
+                .where(tweet_like.c.tweet_id == any_(literal(list(likes), ARRAY(Integer))))
             )
-        ).scalar()
-
-        return {
-            "id": tweet.id,
-            "content": tweet.content,
-            "attachments": tweet.attachments,
-            "author": {"id": tweet.author.id, "name": tweet.author.name},
-            "likes": [{'user_id': user.id, "name": user.name} for user in tweet.users_likes],
-        }
+            for tweet_id, user_id, name in users_likes:
+                likes[tweet_id].append({"user_id": user_id, "name": name})
+
+        return [
+            {
+                "id": tweet.id,
+                "content": tweet.content,
+                "attachments": tweet.attachments,
+                "author": {"id": tweet.author_id, "name": tweet.author_name},
+                "likes": likes[tweet.id],
+            }
+            for tweet in tweets
+        ]
 
 
 class Tape(TweetApiFormatMixin):
-    _process_users = []
-    _users = []
-    _tweets = []
+    page_size = 20
+
+    def __init__(self, session: AsyncSession, owner_id: int):
+        self._session = session
+        self._process_users = [owner_id]
 
     @classmethod
-    async def get_tape(cls, session: AsyncSession, api_key: str):
-        owner = await cls._get_owner(session, api_key)
-        cls._process_users.append(owner.id)
-        await cls._sorting_owner_subscriptions(session, owner)
+    async def get_tape(
+        cls, session: AsyncSession, owner_id: int, limit: int | None = None, cursor: str | None = None
+    ):
+        if cursor is not None:
+            cursor = decode_cursor(cursor, 3)
+            limit = limit or cls.page_size
+
+        tape = cls(session, owner_id)
+        await tape._sorting_owner_subscriptions(owner_id)
+        return await tape._get_tape(limit, cursor)
+
+    async def _sorting_owner_subscriptions(self, owner_id: int):
+        self._process_users.extend(
+            (
+                await self._session.execute(
+                    select(User.id)
+                    .join(follows, follows.c.followee_id == User.id)
+                    .where(follows.c.follower_id == owner_id)
+                    .order_by(desc(User.followers_count), User.id)
+                )
+            ).scalars()
+        )
 
-        tape = await cls._get_tape(session)
-        await cls._reset()
-        return tape
+    async def _get_tape(self, limit: int | None, cursor: tuple[int, int, int] | None):
+        ranked = list(dict.fromkeys(self._process_users))
+        if limit is None:
+            tweets = await self._get_all_tweets(ranked)
+        else:
+            tweets = await self._get_page(ranked, limit + 1, cursor or (0, 0, None))
 
-    @classmethod
-    async def _reset(cls):
-        cls._process_users = []
-        cls._users = []
-        cls._tweets = []
+        next_cursor = None
+        if limit is not None and len(tweets) > limit:
+            tweets = tweets[:limit]
+            last = tweets[-1]
+            next_cursor = encode_cursor((last.position, last.author_id, last.id))
 
-    @classmethod
-    async def _get_owner(cls, session: AsyncSession, api_key: str):
-        user = (
-            await session.execute(
-                select(User)
-                .where(User.api_key == api_key)
-                .options(selectinload(User.tweets), selectinload(User.subscriptions))
+        return {
+            "result": True,
+            "tweets": await self._build_tweets_as_api_format(self._session, tweets),
+            "next_cursor": next_cursor,
+        }
+
+    async def _get_all_tweets(self, ranked: list[int]):
+        position = case(
+            {user_id: position for position, user_id in enumerate(ranked)},
+            value=Tweet.user_id,
+            else_=len(ranked),
+        )
+        return (
+            await self._session.execute(
+                select(
+                    Tweet.id,
+                    Tweet.content,
+                    Tweet.attachments,
+                    User.id.label("author_id"),
+                    User.name.label("author_name"),
+                    position.label("position"),
+                )
+                .join(User, User.id == Tweet.user_id)
+                .order_by(position, Tweet.user_id, desc(Tweet.id))
             )
-        ).scalar()
-        cls._process_users.append(user.id)
-        cls._users.append(user)
-        return user
+        ).all()
 
-    @classmethod
-    async def _sorting_owner_subscriptions(cls, session: AsyncSession, owner: User):
-        user_subscriptions = []
-        for subscribe in owner.subscriptions:
-            cls._process_users.append(subscribe.id)
-            subscribe = (
-                await session.execute(
-                    select(User)
-                    .where(User.id == subscribe.id)
-                    .options(selectinload(User.followers), selectinload(User.tweets))
+    async def _get_page(self, ranked: list[int], limit: int, cursor: tuple[int, int, int | None]):
+        last_position, last_user_id, last_tweet_id = cursor
+        tweets = []
+
+        if last_position < len(ranked):
+            ranked_users = (
+                func.unnest(literal(ranked, ARRAY(Integer)))
+                .table_valued("user_id", with_ordinality="ordinality")
+                .render_derived(name="ranked_users")
+            )
+            position = ranked_users.c.ordinality - 1
+            user_tweets = (
+                select(Tweet.id, Tweet.content, Tweet.attachments, Tweet.user_id)
+                .where(Tweet.user_id == ranked_users.c.user_id)
+                .order_by(desc(Tweet.id))
+                .limit(limit)
+            )
+            if last_tweet_id is not None:
+                user_tweets = user_tweets.where(or_(position > last_position, Tweet.id < last_tweet_id))
+            user_tweets = user_tweets.lateral("user_tweets")
+            tweets = (
+                await self._session.execute(
+                    select(
+                        user_tweets.c.id,
+                        user_tweets.c.content,
+                        user_tweets.c.attachments,
+                        User.id.label("author_id"),
+                        User.name.label("author_name"),
+                        position.label("position"),
+                    )
+                    .select_from(ranked_users)
+                    .join(user_tweets, true())
+                    .join(User, User.id == user_tweets.c.user_id)
+                    .where(position >= last_position)
+                    .order_by(position, desc(user_tweets.c.id))
+                    .limit(limit)
                 )
-            ).scalar()
-            user_subscriptions.append((len(subscribe.followers), subscribe))
-        cls._users.extend(
-            [
-                user
-                for quantity_followers, user in sorted(
-                    user_subscriptions, key=lambda subscribe: subscribe[0], reverse=True
+            ).all()
+            last_position, last_user_id, last_tweet_id = len(ranked), 0, None
+
+        if len(tweets) < limit:
+            query = (
+                select(
+                    Tweet.id,
+                    Tweet.content,
+                    Tweet.attachments,
+                    User.id.label("author_id"),
+                    User.name.label("author_name"),
+                    literal(len(ranked)).label("position"),
+                )
+                .join(User, User.id == Tweet.user_id)
+                .where(Tweet.user_id != all_(literal(ranked, ARRAY(Integer))))
+                .order_by(Tweet.user_id, desc(Tweet.id))
+                .limit(limit - len(tweets))
+            )
+            if last_tweet_id is not None:
+                query = query.where(
+                    Tweet.user_id >= last_user_id,
+                    or_(Tweet.user_id > last_user_id, Tweet.id < last_tweet_id),
                 )
-            ]
+            tweets.extend((await self._session.execute(query)).all())
+
+        return tweets
+
+
+class Timeline(TweetApiFormatMixin):
+    page_size = 20
+
+    @classmethod
+    async def get_timeline(
+        cls, session: AsyncSession, owner_id: int, limit: int | None = None, cursor: str | None = None
+    ):
+        if cursor is not None:
+            cursor = decode_cursor(cursor, 1)
+            limit = limit or cls.page_size
+
+        query = (
+            select(
+                Tweet.id,
+                Tweet.content,
+                Tweet.attachments,
+                User.id.label("author_id"),
+                User.name.label("author_name"),
+            )
+            .select_from(timeline)
+            .join(Tweet, Tweet.id == timeline.c.tweet_id)
+            .join(User, User.id == Tweet.user_id)
+            .where(timeline.c.user_id == owner_id)
+            .order_by(desc(timeline.c.tweet_id))
         )
+        if cursor is not None:
+            query = query.where(timeline.c.tweet_id < cursor[0])
+        if limit is not None:
+            query = query.limit(limit + 1)
+
+        tweets = (await session.execute(query)).all()
+        next_cursor = None
+        if limit is not None and len(tweets) > limit:
+            tweets = tweets[:limit]
+            next_cursor = encode_cursor((tweets[-1].id,))
+
+        return {
+            "result": True,
+            "tweets": await cls._build_tweets_as_api_format(session, tweets),
+            "next_cursor": next_cursor,
+        }
+
+
+class Search(TweetApiFormatMixin):
+    page_size = 20
+    rank_scale = 1000000
 
     @classmethod
-    async def _get_tape(cls, session: AsyncSession):
-        tweets = []
-        cls._users.extend((await session.execute(
-            select(User).filter(~User.id.in_(cls._process_users)).options(selectinload(User.tweets)))).scalars())
+    async def search_tweets(cls, session: AsyncSession, q: str, limit: int | None = None, cursor: str | None = None):
+        limit = limit or cls.page_size
+        query = func.websearch_to_tsquery("simple", q)
+        rank = cast(func.ts_rank(Tweet.search, query) * cls.rank_scale, Integer)
+        matches = (
+            select(Tweet.id, Tweet.content, Tweet.attachments, Tweet.user_id, rank.label("rank"))
+            .where(Tweet.search.op("@@")(query))
+            .order_by(desc(rank), desc(Tweet.id))
+            .limit(limit + 1)
+        )
+        if cursor is not None:
+            matches = matches.where(tuple_(rank, Tweet.id) < tuple_(*decode_cursor(cursor, 2)))
+        matches = matches.subquery("matches")
+        statement = (
+            select(
+                matches.c.id,
+                matches.c.content,
+                matches.c.attachments,
+                User.id.label("author_id"),
+                User.name.label("author_name"),
+                matches.c.rank,
+            )
+            .join(User, User.id == matches.c.user_id)
+            .order_by(desc(matches.c.rank), desc(matches.c.id))
+        )
 
-        for user in cls._users:
-            user_tweets = [await cls._build_tweet_as_api_format(session, tweet) for tweet in user.tweets]
-            user_tweets.reverse()
-            tweets.extend(user_tweets)
+        tweets = (await session.execute(statement)).all()
+        next_cursor = None
+        if len(tweets) > limit:
+            tweets = tweets[:limit]
+            next_cursor = encode_cursor((tweets[-1].rank, tweets[-1].id))
 
-        return {"result": True, "tweets": tweets}
+        return {
+            "result": True,
+            "tweets": await cls._build_tweets_as_api_format(session, tweets),
+            "next_cursor": next_cursor,
+        }
 
 
-class Profile(UserApiFormatMixin):
+def _fan_out_tweet(created):
+    return (
+        insert(timeline)
+        .from_select(
+            ["user_id", "tweet_id"],
+            union(
+                select(created.c.user_id, created.c.id),
+                select(follows.c.follower_id, created.c.id).join(
+                    created, follows.c.followee_id == created.c.user_id
+                ),
+            ),
+        )
+        .cte("fan_out")
+    )
+
+
+def _fan_out_subscription(followed):
+    return (
+        pg_insert(timeline)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(followed.c.follower_id, Tweet.id).join(
+                followed, Tweet.user_id == followed.c.followee_id
+            ),
+        )
+        .on_conflict_do_nothing()
+        .cte("fan_out")
+    )
+
+
+def _drop_subscription(unfollowed):
+    return (
+        delete(timeline)
+        .where(
+            timeline.c.user_id == unfollowed.c.follower_id,
+            timeline.c.tweet_id == Tweet.id,
+            Tweet.user_id == unfollowed.c.followee_id,
+            unfollowed.c.follower_id != unfollowed.c.followee_id,
+        )
+        .cte("fan_in")
+    )
+
+
+async def rebuild_timelines(session: AsyncSession):
+    await session.execute(delete(timeline))
+    await session.execute(
+        insert(timeline).from_select(
+            ["user_id", "tweet_id"],
+            union(
+                select(Tweet.user_id, Tweet.id),
+                select(follows.c.follower_id, Tweet.id).join(
+                    Tweet, Tweet.user_id == follows.c.followee_id
+                ),
+            ),
+        )
+    )
+    await session.commit()
+
+
+class Relations:
+    page_size = 20
+
+    @classmethod
+    async def get_followers(
+        cls, session: AsyncSession, user_id: int, limit: int | None = None, cursor: str | None = None
+    ):
+        return await cls._get_page(session, follows.c.followee_id, follows.c.follower_id, user_id, limit, cursor)
+
     @classmethod
-    async def get_user_profile_by_api_key(cls, session: AsyncSession, api_key: str):
+    async def get_following(
+        cls, session: AsyncSession, user_id: int, limit: int | None = None, cursor: str | None = None
+    ):
+        return await cls._get_page(session, follows.c.follower_id, follows.c.followee_id, user_id, limit, cursor)
+
+    @classmethod
+    async def _get_page(cls, session: AsyncSession, own, other, user_id: int, limit: int | None, cursor: str | None):
+        limit = limit or cls.page_size
         query = (
-            select(User)
-            .options(selectinload(User.subscriptions), selectinload(User.followers))
-            .filter(User.api_key == api_key)
+            select(User.id, User.name)
+            .select_from(follows)
+            .join(User, User.id == other)
+            .where(own == user_id)
+            .order_by(other)
+            .limit(limit + 1)
         )
+        if cursor is not None:
+            query = query.where(other > decode_cursor(cursor, 1)[0])
 
-        user = (await session.execute(query)).scalar()
+        users = (await session.execute(query)).all()
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor((users[-1].id,))
+
+        return {
+            "result": True,
+            "users": [{"id": user.id, "name": user.name} for user in users],
+            "next_cursor": next_cursor,
+        }
 
-        return await cls._build_user_as_api_format(user)
 
+class Profile(UserApiFormatMixin):
     @classmethod
     async def get_user_profile_by_id(cls, session: AsyncSession, user_id: int):
-        query = (
-            select(User)
-            .options(selectinload(User.subscriptions), selectinload(User.followers))
-            .filter(User.id == user_id)
+        user = (
+            await session.execute(
+                select(User.id, User.name, User.followers_count, User.following_count).where(User.id == user_id)
+            )
+        ).one_or_none()
+        if user is None:
+            return None
+        limit = config.PROFILE_PAGE_SIZE
+        return await cls._build_user_as_api_format(
+            user,
+            await Relations.get_followers(session, user_id, limit),
+            await Relations.get_following(session, user_id, limit),
         )
-        user = (await session.execute(query)).scalar()
-
-        return await cls._build_user_as_api_format(user)
 
 
-async def get_user_by_api_key(session: AsyncSession, api_key: str):
+async def get_user_id_by_api_key(session: AsyncSession, api_key: str) -> int | None:
     return (
-        await session.execute(select(User).where(User.api_key == api_key))
+        await session.execute(select(User.id).where(User.api_key == api_key))
     ).scalar()
 
 
-async def get_user_by_id(session: AsyncSession, user_id: str):
+async def get_user_by_id(session: AsyncSession, user_id: int):
     return await session.get(User, ident=user_id)
 
 
-async def add_user(session: AsyncSession, api_key: str):
-    await session.execute(insert(User).values(api_key=api_key))
+async def add_user(session: AsyncSession, api_key: str) -> int:
+    user_id = (
+        await session.execute(
+            pg_insert(User).values(api_key=api_key).on_conflict_do_nothing().returning(User.id)
+        )
+    ).scalar()
+    await session.commit()
+    if user_id is None:
+        user_id = await get_user_id_by_api_key(session, api_key)
+    return user_id
+
+
+async def like(session: AsyncSession, tweet_id: int, user_id: int):
+    liked = (
+        pg_insert(tweet_like)
+        .from_select(["tweet_id", "user_id"], select(Tweet.id, literal(user_id)).where(Tweet.id == tweet_id))
+        .on_conflict_do_nothing()
+        .returning(tweet_like.c.tweet_id)
+        .cte("liked")
+    )
+    await session.execute(
+        update(Tweet)
+        .where(Tweet.id.in_(select(liked.c.tweet_id)))
+        .values(likes_count=Tweet.likes_count + 1)
+    )
     await session.commit()
-    return (await session.execute(select(User).order_by(desc(User.id)).limit(1))).scalar().id
 
 
-async def like(session: AsyncSession, tweet_id: int, api_key: str):
-    user = await get_user_by_api_key(session, api_key)
-    tweet = (await session.execute(
-        select(Tweet).where(Tweet.id == tweet_id).options(selectinload(Tweet.users_likes)))).scalar()
-    tweet.users_likes.append(user)
+async def unlike(session: AsyncSession, tweet_id: int, user_id: int):
+    unliked = (
+        delete(tweet_like)
+        .where(tweet_like.c.tweet_id == tweet_id, tweet_like.c.user_id == user_id)
+        .returning(tweet_like.c.tweet_id)
+        .cte("unliked")
+    )
+    await session.execute(
+        update(Tweet)
+        .where(Tweet.id.in_(select(unliked.c.tweet_id)))
+        .values(likes_count=Tweet.likes_count - 1)
+    )
     await session.commit()
 
 
-async def unlike(session: AsyncSession, tweet_id: int, api_key: str):
-    user = await get_user_by_api_key(session, api_key)
-    tweet = (await session.execute(
-        select(Tweet).where(Tweet.id == tweet_id).options(selectinload(Tweet.users_likes)))).scalar()
-    tweet.users_likes.remove(user)
+async def apply_likes(session: AsyncSession, changes: dict[tuple[int, int], bool]):
+    pending = select(
+        func.unnest(
+            literal([tweet_id for tweet_id, _ in changes], ARRAY(Integer)),
+            literal([user_id for _, user_id in changes], ARRAY(Integer)),
+            literal(list(changes.values()), ARRAY(Boolean)),
+        )
+        .table_valued(column("tweet_id", Integer), column("user_id", Integer), column("liked", Boolean))
+        .render_derived()
+    ).cte("pending")
+    liked = (
+        pg_insert(tweet_like)
+        .from_select(
+            ["tweet_id", "user_id"],
+            select(pending.c.tweet_id, pending.c.user_id)
+            .join(Tweet, Tweet.id == pending.c.tweet_id)
+            .where(pending.c.liked),
+        )
+        .on_conflict_do_nothing()
+        .returning(tweet_like.c.tweet_id)
+        .cte("liked")
+    )
+    unliked = (
+        delete(tweet_like)
+        .where(
+            tweet_like.c.tweet_id == pending.c.tweet_id,
+            tweet_like.c.user_id == pending.c.user_id,
+            ~pending.c.liked,
+        )
+        .returning(tweet_like.c.tweet_id)
+        .cte("unliked")
+    )
+    deltas = union_all(
+        select(liked.c.tweet_id, literal(1).label("delta")),
+        select(unliked.c.tweet_id, literal(-1)),
+    ).subquery()
+    totals = (
+        select(deltas.c.tweet_id, func.sum(deltas.c.delta).label("delta"))
+        .group_by(deltas.c.tweet_id)
+        .subquery()
+    )
+    await session.execute(
+        update(Tweet)
+        .where(Tweet.id == totals.c.tweet_id)
+        .values(likes_count=Tweet.likes_count + totals.c.delta)
+    )
     await session.commit()
 
 
-async def delete_tweet(session: AsyncSession, tweet_id: int, api_key: str):
-    tweet = (
+async def delete_tweet(session: AsyncSession, tweet_id: int, user_id: int) -> bool:
+    deleted = (
         await session.execute(
-            select(Tweet)
-            .where(Tweet.id == tweet_id)
-            .options(selectinload(Tweet.author))
+            delete(Tweet).where(Tweet.id == tweet_id, Tweet.user_id == user_id).returning(Tweet.id)
         )
     ).scalar()
-    if tweet.author.api_key == api_key:
-        await session.delete(tweet)
-        await session.commit()
-        return True
-    else:
-        return False
+    await session.commit()
+    return deleted is not None
 
 
-async def load_tweet(session: AsyncSession, api_key, tweet) -> int:
+async def load_tweet(session: AsyncSession, user_id: int, tweet) -> int:
     content, attachments = tweet.tweet_data, tweet.tweet_media_ids
-    user: User = await get_user_by_api_key(session, api_key)
-    await session.execute(insert(Tweet).values(user_id=user.id, content=content, attachments=attachments))
+    statement = insert(Tweet).values(user_id=user_id, content=content, attachments=attachments)
+    if config.FEED_MODE == "push":
+        created = statement.returning(Tweet.id, Tweet.user_id).cte("created")
+        statement = select(created.c.id).add_cte(_fan_out_tweet(created))
+    else:
+        statement = statement.returning(Tweet.id)
+    tweet_id = (await session.execute(statement)).scalar()
     await session.commit()
-    return (await session.execute(select(Tweet).order_by(desc(Tweet.id)).limit(1))).scalar().id
+    return tweet_id
 
 
-async def load_image(session: AsyncSession, image: bytes):
-    await session.execute(insert(Image).values(image=image))
+async def load_image(session: AsyncSession, digest: str, size: int, mime_type: str) -> int:
+    image_id = (
+        await session.execute(
+            insert(Image).values(sha256=digest, size=size, mime_type=mime_type).returning(Image.id)
+        )
+    ).scalar()
     await session.commit()
-    return (await session.execute(select(Image).order_by(desc(Image.id)).limit(1))).scalar().id
+    return image_id
+
+
+async def migrate_images(session: AsyncSession, batch_size: int = 100):
+    moved = 0
+    while True:
+        images = (
+            await session.execute(
+                select(Image.id, Image.image)
+                .where(Image.image.is_not(None))
+                .order_by(Image.id)
+                .limit(batch_size)
+            )
+        ).all()
+        if not images:
+            return moved
+        for image_id, image in images:
+            digest = await media_store.save(image)
+            await session.execute(
+                update(Image)
+                .where(Image.id == image_id)
+                .values(image=None, sha256=digest, size=len(image), mime_type=sniff_mime_type(image[:32]))
+            )
+        await session.commit()
+        moved += len(images)
+
+
+async def detect_images_mime_type(session: AsyncSession, batch_size: int = 100):
+    detected = 0
+    while True:
+        images = (
+            await session.execute(
+                select(Image.id, Image.sha256)
+                .where(Image.mime_type.is_(None), Image.sha256.is_not(None))
+                .order_by(Image.id)
+                .limit(batch_size)
+            )
+        ).all()
+        if not images:
+            return detected
+        for image_id, digest in images:
+            head = b"".join([chunk async for chunk in media_store.stream(digest, 0, 31)])
+            await session.execute(
+                update(Image).where(Image.id == image_id).values(mime_type=sniff_mime_type(head))
+            )
+        await session.commit()
+        detected += len(images)
 
 
 async def get_image(session: AsyncSession, image_id):
     return await session.get(Image, ident=image_id)
 
 
-async def follow(session: AsyncSession, user_id: int, api_key: str):
-    subscribe: User = (
-        await session.execute(
-            select(User)
-            .where(User.id == user_id)
-            .options(selectinload(User.followers))
+def _count_subscription(changed, delta: int):
+    return (
+        update(User)
+        .where(or_(User.id == changed.c.follower_id, User.id == changed.c.followee_id))
+        .values(
+            following_count=User.following_count
+            + case((User.id == changed.c.follower_id, delta), else_=0),
+            followers_count=User.followers_count
+            + case((User.id == changed.c.followee_id, delta), else_=0),
         )
-    ).scalar()
-    follower: User = (
-        await session.execute(
-            select(User)
-            .where(User.api_key == api_key)
-            .options(selectinload(User.subscriptions))
+    )
+
+
+async def repair_counters(session: AsyncSession):
+    await session.execute(
+        update(User).values(
+            followers_count=select(func.count())
+            .where(follows.c.followee_id == User.id)
+            .scalar_subquery(),
+            following_count=select(func.count())
+            .where(follows.c.follower_id == User.id)
+            .scalar_subquery(),
         )
-    ).scalar()
-    follower.subscriptions.append(subscribe)
-    subscribe.followers.append(follower)
+    )
+    await session.execute(
+        update(Tweet).values(
+            likes_count=select(func.count())
+            .where(tweet_like.c.tweet_id == Tweet.id)
+            .scalar_subquery()
+        )
+    )
     await session.commit()
 
 
-async def unfollow(session: AsyncSession, user_id: int, api_key: str):
-    subscribe: User = (
-        await session.execute(
-            select(User)
-            .where(User.id == user_id)
-            .options(selectinload(User.followers))
-        )
-    ).scalar()
-    follower: User = (
-        await session.execute(
-            select(User)
-            .where(User.api_key == api_key)
-            .options(selectinload(User.subscriptions))
-        )
-    ).scalar()
-    try:
-        follower.subscriptions.remove(subscribe)
-        subscribe.followers.remove(follower)
-    except ValueError:
-        return
+async def follow(session: AsyncSession, user_id: int, follower_id: int):
+    followed = (
+        pg_insert(follows)
+        .values(follower_id=follower_id, followee_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(follows.c.follower_id, follows.c.followee_id)
+        .cte("followed")
+    )
+    statement = _count_subscription(followed, 1)
+    if config.FEED_MODE == "push":
+        statement = statement.add_cte(_fan_out_subscription(followed))
+    await session.execute(statement)
+    await session.commit()
+
+
+async def unfollow(session: AsyncSession, user_id: int, follower_id: int):
+    unfollowed = (
+        delete(follows)
+        .where(follows.c.follower_id == follower_id, follows.c.followee_id == user_id)
+        .returning(follows.c.follower_id, follows.c.followee_id)
+        .cte("unfollowed")
+    )
+    statement = _count_subscription(unfollowed, -1)
+    if config.FEED_MODE == "push":
+        statement = statement.add_cte(_drop_subscription(unfollowed))
+    await session.execute(statement)
     await session.commit()
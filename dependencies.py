@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import AsyncIterator
+from fastapi import Depends, Header
+import config
+from repository import Repository, open_repository
+
+
+class UserCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._users: OrderedDict[str, tuple[int, float]] = OrderedDict()
+
+    def get(self, api_key: str) -> int | None:
+        cached = self._users.get(api_key)
+        if cached is None or cached[1] < monotonic():
+            self._users.pop(api_key, None)
+            self.misses += 1
+            return None
+        self._users.move_to_end(api_key)
+        self.hits += 1
+        return cached[0]
+
+    def set(self, api_key: str, user_id: int):
+        self._users[api_key] = (user_id, monotonic() + self.ttl)
+        self._users.move_to_end(api_key)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def invalidate(self, api_key: str):
+        self._users.pop(api_key, None)
+
+    def invalidate_user(self, user_id: int):
+        for api_key in [api_key for api_key, (id_, _) in self._users.items() if id_ == user_id]:
+            del self._users[api_key]
+
+    def clear(self):
+        self._users.clear()
+
+
+user_cache = UserCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+
+async def get_repository() -> AsyncIterator[Repository]:
+    async with open_repository() as repository:
+        yield repository
+
+
+async def current_user_id(api_key: str = Header(), repository: Repository = Depends(get_repository)) -> int:
+    user_id = user_cache.get(api_key)
+    if user_id is not None:
+        return user_id
+
+    user_id = await repository.get_user_id_by_api_key(api_key)
+    if user_id is None:
+        user_id = await repository.add_user(api_key)
+
+    user_cache.set(api_key, user_id)
+    return user_id
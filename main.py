@@ -1,12 +1,45 @@
+import asyncio
+import os
 import uvicorn
-from time import sleep
+from time import time
 from dotenv import find_dotenv, load_dotenv
 load_dotenv(find_dotenv())
 
+import config
+from assets import precompress
+from database.engine import engine, run_migrations, wait_for_database
+
+
+async def prepare():
+    attempts = await wait_for_database(config.DB_WAIT_TIMEOUT)
+    print(f"Database reachable after {attempts} attempt(s)")
+    await run_migrations()
+    await engine.dispose()
+
 
 def docker_startup():
-    sleep(10)
-    uvicorn.run("routers:app", host="0.0.0.0")
+    os.environ.setdefault("STARTED_AT", str(time()))
+    if config.STATIC_PRECOMPRESS:
+        print(f"Precompressed {precompress('static')} static file(s)")
+    if config.REPOSITORY_BACKEND == "sql":
+        asyncio.run(prepare())
+        os.environ["MIGRATE_ON_STARTUP"] = "0"
+        config.MIGRATE_ON_STARTUP = False
+    if config.WORKERS > 1 and (config.CONDITIONAL_GET or config.RESPONSE_CACHE_SIZE > 0):
+        print("CONDITIONAL_GET and RESPONSE_CACHE_SIZE are per-process and disabled with WORKERS > 1")
+        os.environ["CONDITIONAL_GET"], os.environ["RESPONSE_CACHE_SIZE"] = "0", "0"
+        config.CONDITIONAL_GET, config.RESPONSE_CACHE_SIZE = False, 0
+    if config.WORKERS > 1 and config.LIKE_BUFFER:
+        print("LIKE_BUFFER is per-process and disabled with WORKERS > 1")
+        os.environ["LIKE_BUFFER"] = "0"
+        config.LIKE_BUFFER = False
+    uvicorn.run(
+        "routers:app",
+        host="0.0.0.0",
+        workers=config.WORKERS,
+        loop=config.UVICORN_LOOP,
+        http=config.UVICORN_HTTP,
+    )
 
 
 def local_startup():
@@ -16,4 +49,3 @@ def local_startup():
 if __name__ == "__main__":
     # local_startup()
     docker_startup()
-
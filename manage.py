@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+from dotenv import find_dotenv, load_dotenv
+load_dotenv(find_dotenv())
+
+import config
+from assets import precompress
+from database.engine import run_migrations, session_factory
+from database.queries import detect_images_mime_type, migrate_images, rebuild_timelines, repair_counters
+
+
+async def rebuild_timelines_():
+    await run_migrations()
+    async with session_factory() as session:
+        await rebuild_timelines(session)
+
+
+async def migrate_images_():
+    await run_migrations()
+    async with session_factory() as session:
+        moved = await migrate_images(session, int(os.getenv("BATCH_SIZE", 100)))
+        detected = await detect_images_mime_type(session, int(os.getenv("BATCH_SIZE", 100)))
+    print(f"Moved {moved} images to {config.MEDIA_ROOT}, detected type of {detected}")
+
+
+async def repair_counters_():
+    await run_migrations()
+    async with session_factory() as session:
+        await repair_counters(session)
+
+
+async def compress_static():
+    print(f"Precompressed {precompress('static')} static file(s)")
+
+
+commands = {
+    "rebuild-timelines": rebuild_timelines_,
+    "migrate-media": migrate_images_,
+    "repair-counters": repair_counters_,
+    "compress-static": compress_static,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        sys.exit(f"usage: python manage.py {{{'|'.join(commands)}}}")
+    asyncio.run(commands[sys.argv[1]]())
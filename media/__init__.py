@@ -0,0 +1,4 @@
+import config
+from media.storage import MediaStore, LocalMediaStore, backends
+
+media_store: MediaStore = backends[config.MEDIA_BACKEND](config.MEDIA_ROOT)
@@ -0,0 +1,81 @@
+from hashlib import sha256
+from typing import AsyncIterator, Callable
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from database.models import Image
+from media.mime import sniff_mime_type
+from media.storage import MediaStore
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start, _, end = ranges.strip().partition("-")
+    try:
+        if not start:
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    return any(
+        candidate.strip().removeprefix("W/") in (etag, "*")
+        for candidate in header.split(",")
+    )
+
+
+def _ranged_response(
+    request: Request, key: str, size: int, mime_type: str, body: Callable[[int, int], bytes | AsyncIterator[bytes]]
+) -> Response:
+    headers = {"ETag": f'"{key}"', "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if _etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = _parse_range(request.headers["range"], size) if "range" in request.headers else None
+    except ValueError:
+        return Response(status_code=416, headers=headers | {"Content-Range": f"bytes */{size}"})
+
+    status_code, (start, end) = 200, (0, size - 1)
+    if byte_range is not None:
+        status_code, (start, end) = 206, byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    content = body(start, end)
+    if isinstance(content, bytes):
+        return Response(content, status_code, headers, mime_type)
+    return StreamingResponse(content, status_code, headers, mime_type)
+
+
+def media_response(request: Request, image: Image, store: MediaStore) -> Response:
+    if image.image is not None:
+        return _ranged_response(
+            request,
+            sha256(image.image).hexdigest(),
+            len(image.image),
+            image.mime_type or sniff_mime_type(image.image[:32]),
+            lambda start, end: image.image[start:end + 1],
+        )
+    return stored_media_response(
+        request, store, image.sha256, image.size, image.mime_type or "application/octet-stream"
+    )
+
+
+def stored_media_response(request: Request, store: MediaStore, key: str, size: int, mime_type: str) -> Response:
+    return _ranged_response(
+        request,
+        key,
+        size,
+        mime_type,
+        lambda start, end: store.stream(key, start, end),
+    )
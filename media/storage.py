@@ -0,0 +1,136 @@
+from abc import ABC, abstractmethod
+from hashlib import sha256
+from pathlib import Path
+from typing import AsyncIterator
+from uuid import uuid4
+import aiofiles
+import aiofiles.os
+
+
+class MediaWriter(ABC):
+    @abstractmethod
+    async def write(self, chunk: bytes):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def commit(self) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def abort(self):
+        raise NotImplementedError
+
+
+class MediaStore(ABC):
+    @abstractmethod
+    def writer(self) -> MediaWriter:
+        raise NotImplementedError
+
+    async def save(self, data: bytes) -> str:
+        writer = self.writer()
+        try:
+            await writer.write(data)
+        except BaseException:
+            await writer.abort()
+            raise
+        return await writer.commit()
+
+    @abstractmethod
+    async def put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+
+class LocalMediaWriter(MediaWriter):
+    def __init__(self, store: "LocalMediaStore"):
+        self._store = store
+        self._hash = sha256()
+        self._file = None
+
+    async def write(self, chunk: bytes):
+        if self._file is None:
+            await aiofiles.os.makedirs(self._store.root, exist_ok=True)
+            self._file = await aiofiles.open(self._store.root / f".upload-{uuid4().hex}", "wb")
+        self._hash.update(chunk)
+        await self._file.write(chunk)
+
+    async def commit(self) -> str:
+        digest = self._hash.hexdigest()
+        if self._file is None:
+            await self.write(b"")
+        await self._file.close()
+        if await self._store.exists(digest):
+            await aiofiles.os.remove(self._file.name)
+        else:
+            path = self._store.path(digest)
+            await aiofiles.os.makedirs(path.parent, exist_ok=True)
+            await aiofiles.os.replace(self._file.name, path)
+        return digest
+
+    async def abort(self):
+        if self._file is not None:
+            await self._file.close()
+            await aiofiles.os.remove(self._file.name)
+
+
+class LocalMediaStore(MediaStore):
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def writer(self) -> LocalMediaWriter:
+        return LocalMediaWriter(self)
+
+    async def put(self, key: str, data: bytes):
+        path = self.path(key)
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        temporary = self.root / f".upload-{uuid4().hex}"
+        async with aiofiles.open(temporary, "wb") as file:
+            await file.write(data)
+        await aiofiles.os.replace(temporary, path)
+
+    async def read(self, key: str) -> bytes:
+        async with aiofiles.open(self.path(key), "rb") as file:
+            return await file.read()
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.path(key))
+
+    async def size(self, key: str) -> int:
+        return await aiofiles.os.path.getsize(self.path(key))
+
+    async def stream(
+        self, key: str, start: int = 0, end: int | None = None, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.path(key), "rb") as file:
+            await file.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+
+backends = {
+    "local": LocalMediaStore,
+}
@@ -0,0 +1,90 @@
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+from media.mime import sniff_mime_type
+from media.storage import MediaStore
+
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception): ...
+
+
+class _FilePart:
+    def __init__(self, field_name: bytes):
+        self.field_name = field_name
+        self.found = False
+        self.chunks: list[bytes] = []
+        self._in_file = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._in_file = False
+        self._disposition = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.chunks.append(data[start:end])
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._in_file = not self.found and options.get(b"name") == self.field_name
+        self.found = self.found or self._in_file
+
+
+async def receive_upload(
+    request: Request, store: MediaStore, max_size: int, field_name: str = "file"
+) -> tuple[str, int, str]:
+    content_length = request.headers.get("content-length")
+    if content_length is not None and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise ValueError("Expected a multipart/form-data body")
+
+    part = _FilePart(field_name.encode())
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    writer = store.writer()
+    size, head = 0, b""
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for data in part.chunks:
+                size += len(data)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                if len(head) < 32:
+                    head += data[:32 - len(head)]
+                await writer.write(data)
+            part.chunks.clear()
+        parser.finalize()
+        if not part.found:
+            raise ValueError(f"Missing '{field_name}' file field")
+    except BaseException:
+        await writer.abort()
+        raise
+
+    return await writer.commit(), size, sniff_mime_type(head)
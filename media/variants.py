@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import get_context
+from PIL import Image, ImageOps
+import config
+from media.storage import MediaStore
+
+formats = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+source_mime_types = {"image/jpeg", "image/png", "image/gif", "image/bmp", "image/webp", "image/tiff"}
+_pool: ProcessPoolExecutor | None = None
+_rendering: dict[str, asyncio.Future] = {}
+
+
+def render_variant(data: bytes, size: int, image_format: str, quality: int) -> bytes:
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        output = BytesIO()
+        image.save(output, image_format, quality=quality)
+    return output.getvalue()
+
+
+def variant_key(digest: str, size: int) -> str:
+    return f"{digest}-{size}.{config.MEDIA_VARIANT_FORMAT}"
+
+
+def variant_mime_type() -> str:
+    return formats[config.MEDIA_VARIANT_FORMAT][1]
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(config.MEDIA_WORKERS, mp_context=get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def _render(store: MediaStore, digest: str, size: int, key: str):
+    variant = await asyncio.get_running_loop().run_in_executor(
+        get_pool(),
+        render_variant,
+        await store.read(digest),
+        size,
+        formats[config.MEDIA_VARIANT_FORMAT][0],
+        config.MEDIA_VARIANT_QUALITY,
+    )
+    await store.put(key, variant)
+
+
+async def ensure_variant(store: MediaStore, digest: str, size: int) -> str:
+    key = variant_key(digest, size)
+    if await store.exists(key):
+        return key
+    if key not in _rendering:
+        _rendering[key] = asyncio.ensure_future(_render(store, digest, size, key))
+        _rendering[key].add_done_callback(lambda _: _rendering.pop(key, None))
+    await asyncio.shield(_rendering[key])
+    return key
+
+
+async def render_variants(store: MediaStore, digest: str):
+    for size in config.MEDIA_VARIANT_SIZES:
+        await ensure_variant(store, digest, size)
@@ -0,0 +1,152 @@
+import os
+from time import time
+from typing import Callable
+from database.engine import engine
+from database.likes import like_buffer
+from dependencies import user_cache
+from caching import response_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+STARTED_AT = float(os.getenv("STARTED_AT", time()))
+
+registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), function: Callable = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.function = function
+        self.values = {}
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, "", self.function()
+        for key, value in self.values.items():
+            yield self.name, _labels(self.labels, key), value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        if key not in self.values:
+            self.values[key] = [0] * len(self.buckets) + [0, 0]
+        counts = self.values[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def samples(self):
+        for key, counts in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", _labels(self.labels, key, f'le="{bound}"'), count
+            yield f"{self.name}_bucket", _labels(self.labels, key, 'le="+Inf"'), counts[-1]
+            yield f"{self.name}_sum", _labels(self.labels, key), counts[-2]
+            yield f"{self.name}_count", _labels(self.labels, key), counts[-1]
+
+
+def render() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route")
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests being served.", ("method",)
+)
+http_request_sql_statements = Histogram(
+    "http_request_sql_statements", "SQL statements executed per request.", ("method", "route"), STATEMENT_BUCKETS
+)
+http_request_sql_duration = Histogram(
+    "http_request_sql_seconds", "Time spent in SQL per request.", ("method", "route")
+)
+cold_start = Gauge("cold_start_seconds", "Time from launcher start to the first ready check of this worker.")
+
+
+def record_cold_start():
+    if not cold_start.values:
+        cold_start.inc(time() - STARTED_AT)
+        print(f"Ready {cold_start.values[()]:.2f}s after start (pid {os.getpid()})")
+
+
+for stat, documentation in (
+    ("size", "Connections kept in the pool."),
+    ("checked_out", "Connections currently checked out."),
+    ("overflow", "Connections open above the pool size."),
+    ("max_wait_seconds", "Longest wait for a connection."),
+):
+    Gauge(f"db_pool_{stat}", documentation, function=lambda stat=stat: engine.pool.stats()[stat])
+Counter("db_pool_checkouts_total", "Connection checkouts.", function=lambda: engine.pool.stats()["checkouts"])
+Counter(
+    "db_pool_wait_seconds_total", "Time spent waiting for a connection.",
+    function=lambda: engine.pool.stats()["wait_seconds"],
+)
+
+Counter("user_cache_hits_total", "User cache hits.", function=lambda: user_cache.hits)
+Counter("user_cache_misses_total", "User cache misses.", function=lambda: user_cache.misses)
+Counter("response_cache_hits_total", "Response cache hits.", function=lambda: response_cache.hits)
+Counter("response_cache_misses_total", "Response cache misses.", function=lambda: response_cache.misses)
+Gauge("response_cache_entries", "Responses held in the cache.", function=lambda: len(response_cache))
+Counter("like_buffer_flushes_total", "Like buffer flushes.", function=lambda: like_buffer.flushes)
+Counter("like_buffer_flush_failures_total", "Failed like buffer flushes.", function=lambda: like_buffer.failures)
+Counter("like_buffer_flushed_total", "Likes written by buffer flushes.", function=lambda: like_buffer.flushed)
+Counter(
+    "like_buffer_flush_seconds_total", "Time spent flushing the like buffer.",
+    function=lambda: like_buffer.flush_seconds,
+)
+Gauge("like_buffer_last_flush_size", "Likes in the last flush.", function=lambda: like_buffer.last_flush_size)
+Gauge(
+    "like_buffer_last_flush_seconds", "Duration of the last flush.", function=lambda: like_buffer.last_flush_seconds
+)
@@ -0,0 +1,42 @@
+import asyncio
+import os
+from logging.config import fileConfig
+from alembic import context
+from dotenv import find_dotenv, load_dotenv
+from sqlalchemy import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+from database.models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(url=os.getenv("BASE"), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    engine = create_async_engine(os.getenv("BASE"))
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+if config.attributes.get("connection") is not None:
+    do_run_migrations(config.attributes["connection"])
+else:
+    load_dotenv(find_dotenv())
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    if context.is_offline_mode():
+        run_migrations_offline()
+    else:
+        asyncio.run(run_async_migrations())
@@ -0,0 +1,34 @@
+"""image metadata
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 19:33:32.877310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('image', 'image', existing_type=sa.LargeBinary(), nullable=True)
+    op.add_column('image', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('image', sa.Column('size', sa.Integer(), nullable=True))
+    op.add_column('image', sa.Column('mime_type', sa.String(), nullable=True))
+    op.create_index(op.f('ix_image_sha256'), 'image', ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_image_sha256'), table_name='image')
+    op.drop_column('image', 'mime_type')
+    op.drop_column('image', 'size')
+    op.drop_column('image', 'sha256')
+    op.alter_column('image', 'image', existing_type=sa.LargeBinary(), nullable=False)
@@ -0,0 +1,43 @@
+"""counters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 19:33:34.520961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user', sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('tweet', sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        """
+        WITH edges AS (
+            SELECT subscription_id AS follower_id, user_id AS followee_id FROM subscription
+            UNION
+            SELECT user_id, follower_id FROM follower
+        )
+        UPDATE "user" SET
+            followers_count = (SELECT count(*) FROM edges WHERE followee_id = "user".id),
+            following_count = (SELECT count(*) FROM edges WHERE follower_id = "user".id)
+        """
+    )
+    op.execute("UPDATE tweet SET likes_count = (SELECT count(*) FROM tweet_like WHERE tweet_id = tweet.id)")
+
+
+def downgrade() -> None:
+    op.drop_column('tweet', 'likes_count')
+    op.drop_column('user', 'following_count')
+    op.drop_column('user', 'followers_count')
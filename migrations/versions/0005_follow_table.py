@@ -0,0 +1,60 @@
+"""follow table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 19:33:36.012458
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('follow',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followee_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['followee_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+    op.create_index('ix_follow_followee_id_follower_id', 'follow', ['followee_id', 'follower_id'], unique=False)
+    op.execute(
+        """
+        INSERT INTO follow (follower_id, followee_id)
+        SELECT subscription_id, user_id FROM subscription
+        UNION
+        SELECT user_id, follower_id FROM follower
+        """
+    )
+    op.drop_table('subscription')
+    op.drop_table('follower')
+
+
+def downgrade() -> None:
+    op.create_table('follower',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'follower_id')
+    )
+    op.create_table('subscription',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('subscription_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['subscription_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'subscription_id')
+    )
+    op.execute("INSERT INTO subscription (user_id, subscription_id) SELECT followee_id, follower_id FROM follow")
+    op.execute("INSERT INTO follower (user_id, follower_id) SELECT follower_id, followee_id FROM follow")
+    op.drop_index('ix_follow_followee_id_follower_id', table_name='follow')
+    op.drop_table('follow')
@@ -0,0 +1,32 @@
+"""cascade tweet likes
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 20:41:12.318554
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('tweet_like_tweet_id_fkey', 'tweet_like', type_='foreignkey')
+    op.drop_constraint('tweet_like_user_id_fkey', 'tweet_like', type_='foreignkey')
+    op.create_foreign_key('tweet_like_tweet_id_fkey', 'tweet_like', 'tweet', ['tweet_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('tweet_like_user_id_fkey', 'tweet_like', 'user', ['user_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    op.drop_constraint('tweet_like_user_id_fkey', 'tweet_like', type_='foreignkey')
+    op.drop_constraint('tweet_like_tweet_id_fkey', 'tweet_like', type_='foreignkey')
+    op.create_foreign_key('tweet_like_user_id_fkey', 'tweet_like', 'user', ['user_id'], ['id'])
+    op.create_foreign_key('tweet_like_tweet_id_fkey', 'tweet_like', 'tweet', ['tweet_id'], ['id'])
@@ -0,0 +1,34 @@
+"""tweet search
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 22:05:47.102931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tweet', sa.Column(
+        'search',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple', coalesce(content, ''))", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_tweet_search', 'tweet', ['search'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweet_search', table_name='tweet', postgresql_using='gin')
+    op.drop_column('tweet', 'search')
@@ -12,6 +12,10 @@ class ProfileModel(BaseModel):
     name: str
     followers: List[UserModel | None]
     following: List[UserModel | None]
+    followers_count: int
+    following_count: int
+    followers_next_cursor: str | None = None
+    following_next_cursor: str | None = None
 
 
 class UserProfileModel(BaseModel):
@@ -19,6 +23,12 @@ class UserProfileModel(BaseModel):
     user: ProfileModel
 
 
+class UserListModel(BaseModel):
+    result: bool
+    users: List[UserModel]
+    next_cursor: str | None = None
+
+
 class TweetCreateModel(BaseModel):
     result: bool
     tweet_id: int
@@ -49,3 +59,4 @@ class TweetModel(BaseModel):
 class TapeModel(BaseModel):
     result: bool
     tweets: List[TweetModel]
+    next_cursor: str | None = None
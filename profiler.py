@@ -0,0 +1,40 @@
+import sys
+import threading
+from collections import Counter
+from time import monotonic, sleep
+
+_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Counter:
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already being captured")
+    try:
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        deadline = monotonic() + seconds
+        while monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+            sleep(interval)
+        return stacks
+    finally:
+        _lock.release()
+
+
+def collapse(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,18 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import config
+from database.engine import session_factory
+from repository.base import Repository
+from repository.memory import MemoryRepository
+from repository.sql import SqlRepository
+
+memory_repository = MemoryRepository()
+
+
+@asynccontextmanager
+async def open_repository() -> AsyncIterator[Repository]:
+    if config.REPOSITORY_BACKEND == "memory":
+        yield memory_repository
+        return
+    async with session_factory() as session:
+        yield SqlRepository(session)
@@ -0,0 +1,75 @@
+from abc import ABC, abstractmethod
+from database.models import Image
+
+
+class Repository(ABC):
+    @abstractmethod
+    async def get_user_id_by_api_key(self, api_key: str) -> int | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_user(self, api_key: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_profile(self, user_id: int) -> dict | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_followers(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_following(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_tape(self, owner_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_timeline(self, owner_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search_tweets(self, q: str, limit: int | None = None, cursor: str | None = None) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_tweet(self, user_id: int, tweet) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_tweet(self, tweet_id: int, user_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def like(self, tweet_id: int, user_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def unlike(self, tweet_id: int, user_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def apply_likes(self, changes: dict[tuple[int, int], bool]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def follow(self, user_id: int, follower_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def unfollow(self, user_id: int, follower_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_image(self, digest: str, size: int, mime_type: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_image(self, image_id: int) -> Image | None:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
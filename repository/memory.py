@@ -0,0 +1,203 @@
+import re
+from bisect import bisect_right
+from collections import Counter
+from heapq import merge
+from itertools import count, dropwhile, islice
+import config
+from database.models import Image
+from database.queries import decode_cursor, encode_cursor
+from repository.base import Repository
+
+
+class MemoryRepository(Repository):
+    page_size = 20
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._user_ids, self._tweet_ids, self._image_ids = count(1), count(1), count(1)
+        self._users: dict[int, dict] = {}
+        self._api_keys: dict[str, int] = {}
+        self._followers: dict[int, dict[int, None]] = {}
+        self._following: dict[int, dict[int, None]] = {}
+        self._tweets: dict[int, dict] = {}
+        self._user_tweets: dict[int, list[int]] = {}
+        self._likes: dict[int, dict[int, None]] = {}
+        self._images: dict[int, Image] = {}
+
+    async def get_user_id_by_api_key(self, api_key: str) -> int | None:
+        return self._api_keys.get(api_key)
+
+    async def add_user(self, api_key: str) -> int:
+        if api_key not in self._api_keys:
+            user_id = next(self._user_ids)
+            self._users[user_id] = {"id": user_id, "name": "User"}
+            self._api_keys[api_key] = user_id
+            self._followers[user_id], self._following[user_id] = {}, {}
+            self._user_tweets[user_id] = []
+        return self._api_keys[api_key]
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "name": self._users[user_id]["name"]}
+
+    def _relations(self, relations: dict[int, None], limit: int | None, cursor: str | None) -> dict:
+        limit = limit or self.page_size
+        user_ids = sorted(relations)
+        if cursor is not None:
+            user_ids = user_ids[bisect_right(user_ids, decode_cursor(cursor, 1)[0]):]
+        page, next_cursor = self._page(iter(user_ids), limit, lambda user_id: (user_id,))
+        return {"result": True, "users": [self._user(user_id) for user_id in page], "next_cursor": next_cursor}
+
+    async def get_followers(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        return self._relations(self._followers.get(user_id, {}), limit, cursor)
+
+    async def get_following(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        return self._relations(self._following.get(user_id, {}), limit, cursor)
+
+    async def get_profile(self, user_id: int) -> dict | None:
+        if user_id not in self._users:
+            return None
+        followers = await self.get_followers(user_id, config.PROFILE_PAGE_SIZE)
+        following = await self.get_following(user_id, config.PROFILE_PAGE_SIZE)
+        return {
+            "result": True,
+            "user": {
+                **self._user(user_id),
+                "followers": followers["users"],
+                "following": following["users"],
+                "followers_count": len(self._followers[user_id]),
+                "following_count": len(self._following[user_id]),
+                "followers_next_cursor": followers["next_cursor"],
+                "following_next_cursor": following["next_cursor"],
+            },
+        }
+
+    def _format(self, tweet_ids) -> list[dict]:
+        tweets = []
+        for tweet_id in tweet_ids:
+            tweet = self._tweets[tweet_id]
+            author = self._users[tweet["user_id"]]
+            tweets.append(
+                {
+                    "id": tweet_id,
+                    "content": tweet["content"],
+                    "attachments": tweet["attachments"],
+                    "author": {"id": author["id"], "name": author["name"]},
+                    "likes": [
+                        {"user_id": user_id, "name": self._users[user_id]["name"]}
+                        for user_id in self._likes[tweet_id]
+                    ],
+                }
+            )
+        return tweets
+
+    def _page(self, keys, limit: int | None, cursor_key):
+        page = list(keys if limit is None else islice(keys, limit + 1))
+        next_cursor = None
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(cursor_key(page[-1]))
+        return page, next_cursor
+
+    async def get_tape(self, owner_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        if cursor is not None:
+            cursor = decode_cursor(cursor, 3)
+            limit = limit or self.page_size
+
+        ranked = list(dict.fromkeys([owner_id, *sorted(
+            self._following[owner_id], key=lambda user_id: (-len(self._followers[user_id]), user_id)
+        )]))
+        tail = len(ranked)
+
+        def order(key):
+            position, user_id, tweet_id = key
+            return position, user_id if position == tail else 0, -tweet_id
+
+        def keys():
+            for position, user_id in enumerate(ranked):
+                for tweet_id in reversed(self._user_tweets[user_id]):
+                    yield position, user_id, tweet_id
+            for user_id in sorted(set(self._user_tweets) - set(ranked)):
+                for tweet_id in reversed(self._user_tweets[user_id]):
+                    yield tail, user_id, tweet_id
+
+        tape = keys()
+        if cursor is not None:
+            tape = dropwhile(lambda key: order(key) <= order(cursor), tape)
+        page, next_cursor = self._page(tape, limit, lambda key: key)
+        return {"result": True, "tweets": self._format(key[2] for key in page), "next_cursor": next_cursor}
+
+    async def get_timeline(self, owner_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        if cursor is not None:
+            cursor = decode_cursor(cursor, 1)
+            limit = limit or self.page_size
+
+        timeline = merge(
+            *(
+                reversed(self._user_tweets[user_id])
+                for user_id in dict.fromkeys((owner_id, *self._following[owner_id]))
+            ),
+            reverse=True,
+        )
+        if cursor is not None:
+            timeline = dropwhile(lambda tweet_id: tweet_id >= cursor[0], timeline)
+        page, next_cursor = self._page(timeline, limit, lambda tweet_id: (tweet_id,))
+        return {"result": True, "tweets": self._format(page), "next_cursor": next_cursor}
+
+    async def search_tweets(self, q: str, limit: int | None = None, cursor: str | None = None) -> dict:
+        limit = limit or self.page_size
+        terms = re.findall(r"\w+", q.lower())
+        ranked = []
+        for tweet_id, tweet in self._tweets.items():
+            words = Counter(re.findall(r"\w+", (tweet["content"] or "").lower()))
+            if terms and all(term in words for term in terms):
+                ranked.append((sum(words[term] for term in terms), tweet_id))
+        ranked.sort(reverse=True)
+        if cursor is not None:
+            ranked = [key for key in ranked if key < decode_cursor(cursor, 2)]
+        page, next_cursor = self._page(iter(ranked), limit, lambda key: key)
+        return {"result": True, "tweets": self._format(key[1] for key in page), "next_cursor": next_cursor}
+
+    async def load_tweet(self, user_id: int, tweet) -> int:
+        tweet_id = next(self._tweet_ids)
+        self._tweets[tweet_id] = {
+            "user_id": user_id, "content": tweet.tweet_data, "attachments": tweet.tweet_media_ids
+        }
+        self._user_tweets[user_id].append(tweet_id)
+        self._likes[tweet_id] = {}
+        return tweet_id
+
+    async def delete_tweet(self, tweet_id: int, user_id: int) -> bool:
+        if self._tweets.get(tweet_id, {}).get("user_id") != user_id:
+            return False
+        del self._tweets[tweet_id], self._likes[tweet_id]
+        self._user_tweets[user_id].remove(tweet_id)
+        return True
+
+    async def like(self, tweet_id: int, user_id: int):
+        if tweet_id in self._likes:
+            self._likes[tweet_id][user_id] = None
+
+    async def unlike(self, tweet_id: int, user_id: int):
+        self._likes.get(tweet_id, {}).pop(user_id, None)
+
+    async def apply_likes(self, changes: dict[tuple[int, int], bool]):
+        for (tweet_id, user_id), liked in changes.items():
+            await (self.like if liked else self.unlike)(tweet_id, user_id)
+
+    async def follow(self, user_id: int, follower_id: int):
+        self._followers[user_id][follower_id] = None
+        self._following[follower_id][user_id] = None
+
+    async def unfollow(self, user_id: int, follower_id: int):
+        self._followers[user_id].pop(follower_id, None)
+        self._following[follower_id].pop(user_id, None)
+
+    async def load_image(self, digest: str, size: int, mime_type: str) -> int:
+        image_id = next(self._image_ids)
+        self._images[image_id] = Image(id=image_id, sha256=digest, size=size, mime_type=mime_type)
+        return image_id
+
+    async def get_image(self, image_id: int) -> Image | None:
+        return self._images.get(image_id)
@@ -0,0 +1,63 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import queries
+from database.models import Image
+from repository.base import Repository
+
+
+class SqlRepository(Repository):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_user_id_by_api_key(self, api_key: str) -> int | None:
+        return await queries.get_user_id_by_api_key(self.session, api_key)
+
+    async def add_user(self, api_key: str) -> int:
+        return await queries.add_user(self.session, api_key)
+
+    async def get_profile(self, user_id: int) -> dict | None:
+        return await queries.Profile.get_user_profile_by_id(self.session, user_id)
+
+    async def get_followers(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        return await queries.Relations.get_followers(self.session, user_id, limit, cursor)
+
+    async def get_following(self, user_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        return await queries.Relations.get_following(self.session, user_id, limit, cursor)
+
+    async def get_tape(self, owner_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        return await queries.Tape.get_tape(self.session, owner_id, limit, cursor)
+
+    async def get_timeline(self, owner_id: int, limit: int | None = None, cursor: str | None = None) -> dict:
+        return await queries.Timeline.get_timeline(self.session, owner_id, limit, cursor)
+
+    async def search_tweets(self, q: str, limit: int | None = None, cursor: str | None = None) -> dict:
+        return await queries.Search.search_tweets(self.session, q, limit, cursor)
+
+    async def load_tweet(self, user_id: int, tweet) -> int:
+        return await queries.load_tweet(self.session, user_id, tweet)
+
+    async def delete_tweet(self, tweet_id: int, user_id: int) -> bool:
+        return await queries.delete_tweet(self.session, tweet_id, user_id)
+
+    async def like(self, tweet_id: int, user_id: int):
+        await queries.like(self.session, tweet_id, user_id)
+
+    async def unlike(self, tweet_id: int, user_id: int):
+        await queries.unlike(self.session, tweet_id, user_id)
+
+    async def apply_likes(self, changes: dict[tuple[int, int], bool]):
+        await queries.apply_likes(self.session, changes)
+
+    async def follow(self, user_id: int, follower_id: int):
+        await queries.follow(self.session, user_id, follower_id)
+
+    async def unfollow(self, user_id: int, follower_id: int):
+        await queries.unfollow(self.session, user_id, follower_id)
+
+    async def load_image(self, digest: str, size: int, mime_type: str) -> int:
+        return await queries.load_image(self.session, digest, size, mime_type)
+
+    async def get_image(self, image_id: int) -> Image | None:
+        return await queries.get_image(self.session, image_id)
+
+    async def close(self):
+        await self.session.close()
@@ -1,54 +1,91 @@
 import logging
 import sentry_sdk
+import config
+import metrics
+from asyncio import to_thread
+from functools import partial
+from hmac import compare_digest
 from contextlib import asynccontextmanager
-from aiofiles import tempfile
-from sqlalchemy.exc import IntegrityError
-from database.engine import create_all, session_factory, drop_all
-from database.queries import (
-    add_user,
-    load_tweet,
-    load_image,
-    get_image,
-    delete_tweet,
-    like,
-    unlike,
-    follow,
-    unfollow,
-    Profile,
-    Tape
-)
+from time import perf_counter
+from database.engine import QueryStats, query_stats, ping, run_migrations, drop_all
+from database.likes import like_buffer
+from database.queries import InvalidCursor
 from database.models import Tweet
-from fastapi import FastAPI, Request, Header
-from starlette.staticfiles import FileResponse, StaticFiles
-from starlette.responses import JSONResponse
-from models import TweetCreateModel, MediaCreateModel, SuccessModel, TapeModel, UserProfileModel
+from repository import Repository
+from serialization import fast_json, fast_json_tape
+from dependencies import current_user_id, get_repository
+from caching import etag_matches, response_cache, versions
+from assets import AssetFiles, Page
+from profiler import ProfilerBusy, collapse, sample_stacks
+from tracing import init_sentry
+from media import media_store
+from media.responses import media_response, stored_media_response
+from media.uploads import UploadTooLarge, receive_upload
+from media.variants import (
+    ensure_variant, render_variants, shutdown_pool, source_mime_types, variant_mime_type
+)
+from fastapi import FastAPI, Request, Depends, Header, Query, BackgroundTasks
+from starlette.staticfiles import FileResponse
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from sqlalchemy.exc import DBAPIError
+from models import (
+    TweetCreateModel, MediaCreateModel, SuccessModel, TapeModel, UserListModel, UserProfileModel
+)
 
 
-sentry_sdk.init(
-    dsn="https://2fa04535292e980f127d418108745f26@o4506874440318976.ingest.us.sentry.io/4507134751080448",
-    traces_sample_rate=1.0,
-    profiles_sample_rate=1.0,
-)
+init_sentry()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # await drop_all()
-    await create_all()
+    if config.REPOSITORY_BACKEND == "sql" and config.MIGRATE_ON_STARTUP:
+        await run_migrations()
+    if config.LIKE_BUFFER:
+        like_buffer.start()
     yield
+    await like_buffer.stop()
+    shutdown_pool()
 
 
 app = FastAPI(lifespan=lifespan)
 
 exception_collector = logging.getLogger("exception_collector")
 
-app.mount("/css", StaticFiles(directory="static/css"), name="css")
-app.mount("/js", StaticFiles(directory="static/js"), name="js")
+app.mount("/css", AssetFiles(directory="static/css", source_maps=config.STATIC_SOURCE_MAPS), name="css")
+app.mount("/js", AssetFiles(directory="static/js", source_maps=config.STATIC_SOURCE_MAPS), name="js")
+index_page = Page("static/index.html")
+
+
+async def versioned(response: Response, if_none_match: str | None, etag: str, key: tuple, load, render):
+    headers = {}
+    if config.CONDITIONAL_GET:
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "api-key"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    payload = response_cache.get((*key, etag))
+    if payload is None:
+        payload = await load()
+        response_cache.set((*key, etag), payload)
+    result = render(payload)
+    (result if isinstance(result, Response) else response).headers.update(headers)
+    return result
+
+
+def render_profile(payload: dict | None):
+    if payload is None:
+        return JSONResponse({"result": False, "error_type": "NotFound", "error_message": "User not found"}, 404)
+    return fast_json(payload)
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor(request: Request, e: InvalidCursor):
+    return JSONResponse({"result": False, "error_type": "ValidationException", "error_message": str(e)}, 400)
 
 
 @app.get('/')
-async def home():
-    return FileResponse('static/index.html')
+async def home(request: Request):
+    return index_page.response(request)
 
 
 @app.get('/favicon.ico')
@@ -56,107 +93,252 @@ async def favicon():
     return FileResponse('static/favicon.ico')
 
 
-@app.get("/{media_id}")
-async def get_image_(media_id: int):
-    async with session_factory() as session:
-        image = await get_image(session, media_id)
-    async with tempfile.NamedTemporaryFile(delete=False) as file:
-        await file.write(image.image)
-    return FileResponse(file.name, media_type="image/png")
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"result": True}
 
 
-@app.get("/api/users/me", response_model=UserProfileModel)
-async def get_user_profile(api_key=Header()):
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if config.REPOSITORY_BACKEND == "sql":
+        try:
+            await ping()
+        except (OSError, DBAPIError) as e:
+            return JSONResponse(
+                {"result": False, "error_type": "ServiceUnavailable", "error_message": str(e)}, 503
+            )
+    metrics.record_cold_start()
+    return {"result": True}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/profile", include_in_schema=False)
+async def profile_(
+    seconds: float = Query(5, gt=0, le=config.PROFILE_MAX_SECONDS),
+    interval: float = Query(0.005, ge=0.001, le=1),
+    admin_token: str = Header(""),
+):
+    if not config.ADMIN_TOKEN or not compare_digest(admin_token, config.ADMIN_TOKEN):
+        return JSONResponse(
+            {"result": False, "error_type": "Forbidden", "error_message": "Invalid admin token"}, 403
+        )
     try:
-        async with session_factory() as session:
-            await add_user(session, api_key)
-    except IntegrityError:
-        pass
+        stacks = await to_thread(sample_stacks, seconds, interval)
+    except ProfilerBusy as e:
+        return JSONResponse({"result": False, "error_type": "Conflict", "error_message": str(e)}, 409)
+    return PlainTextResponse(collapse(stacks))
 
-    async with session_factory() as session:
-        return await Profile.get_user_profile_by_api_key(session, api_key)
+
+@app.get("/{media_id}")
+async def get_image_(
+    media_id: int, request: Request, size: int | None = None, repository: Repository = Depends(get_repository)
+):
+    if size is not None and size not in config.MEDIA_VARIANT_SIZES:
+        return JSONResponse(
+            {
+                "result": False,
+                "error_type": "ValidationException",
+                "error_message": f"size must be one of {config.MEDIA_VARIANT_SIZES}",
+            },
+            400,
+        )
+    image = await repository.get_image(media_id)
+    await repository.close()
+    if image is None:
+        return JSONResponse(
+            {"result": False, "error_type": "NotFound", "error_message": f"Media {media_id} not found"}, 404
+        )
+    if size is None or image.image is not None or image.mime_type not in source_mime_types:
+        return media_response(request, image, media_store)
+
+    try:
+        key = await ensure_variant(media_store, image.sha256, size)
+    except OSError:
+        return media_response(request, image, media_store)
+    return stored_media_response(request, media_store, key, await media_store.size(key), variant_mime_type())
+
+
+@app.get("/api/users/me", response_model=UserProfileModel)
+async def get_user_profile(
+    response: Response,
+    if_none_match: str | None = Header(None),
+    user_id: int = Depends(current_user_id),
+    repository: Repository = Depends(get_repository),
+):
+    return await versioned(
+        response, if_none_match, versions.profile_etag(user_id), ("profile", user_id),
+        partial(repository.get_profile, user_id), fast_json,
+    )
 
 
 @app.post("/api/tweets", response_model=TweetCreateModel)
-async def load_tweet_(tweet: Tweet.TweetSchema, api_key=Header()):
-    async with session_factory() as session:
-        tweet_id = await load_tweet(session, api_key, tweet)
+async def load_tweet_(
+    tweet: Tweet.TweetSchema,
+    user_id: int = Depends(current_user_id),
+    repository: Repository = Depends(get_repository),
+):
+    tweet_id = await repository.load_tweet(user_id, tweet)
+    versions.tweets_changed()
     return JSONResponse({"result": True, "tweet_id": tweet_id}, 201)
 
 
 @app.delete("/api/tweets/{id}", response_model=SuccessModel)
-async def delete_tweet_(id: int, api_key=Header(...)):
-    async with session_factory() as session:
-        if await delete_tweet(session, id, api_key):
-            return {"result": True}
-        else:
-            return JSONResponse(
-                {
-                    "result": False,
-                    "error_type": "ValidationException",
-                    "error_message": "Cannot delete someone else's tweet",
-                },
-                409,
-            )
+async def delete_tweet_(
+    id: int, user_id: int = Depends(current_user_id), repository: Repository = Depends(get_repository)
+):
+    if await repository.delete_tweet(id, user_id):
+        versions.tweets_changed()
+        return {"result": True}
+    else:
+        return JSONResponse(
+            {
+                "result": False,
+                "error_type": "ValidationException",
+                "error_message": "Cannot delete someone else's tweet",
+            },
+            409,
+        )
 
 
 @app.post("/api/tweets/{id}/likes", response_model=SuccessModel, status_code=201)
-async def like_(id: int, api_key=Header(...)):
-    async with session_factory() as session:
-        await like(session, id, api_key)
+async def like_(
+    id: int, user_id: int = Depends(current_user_id), repository: Repository = Depends(get_repository)
+):
+    if config.LIKE_BUFFER:
+        like_buffer.add(id, user_id, True)
         return {'result': "true"}
+    await repository.like(id, user_id)
+    versions.tweets_changed()
+    return {'result': "true"}
 
 
 @app.delete("/api/tweets/{id}/likes", response_model=SuccessModel)
-async def unlike_(id: int, api_key=Header(...)):
-    async with session_factory() as session:
-        await unlike(session, id, api_key)
+async def unlike_(
+    id: int, user_id: int = Depends(current_user_id), repository: Repository = Depends(get_repository)
+):
+    if config.LIKE_BUFFER:
+        like_buffer.add(id, user_id, False)
         return {"result": True}
+    await repository.unlike(id, user_id)
+    versions.tweets_changed()
+    return {"result": True}
 
 
 @app.post("/api/medias", response_model=MediaCreateModel, status_code=201)
-async def load_image_(request: Request):
-    image = (await request.form()).get("file")
-    async with session_factory() as session:
-        image_id = await load_image(session, await image.read())
+async def load_image_(
+    request: Request, background_tasks: BackgroundTasks, repository: Repository = Depends(get_repository)
+):
+    try:
+        digest, size, mime_type = await receive_upload(request, media_store, config.MAX_UPLOAD_SIZE)
+    except UploadTooLarge as e:
+        return JSONResponse(
+            {"result": False, "error_type": "PayloadTooLarge", "error_message": str(e)}, 413
+        )
+    except ValueError as e:
+        return JSONResponse(
+            {"result": False, "error_type": "ValidationException", "error_message": str(e)}, 400
+        )
+    image_id = await repository.load_image(digest, size, mime_type)
+    if mime_type in source_mime_types:
+        background_tasks.add_task(render_variants, media_store, digest)
     return {"result": True, "media_id": image_id}
 
 
 @app.get("/api/tweets", response_model=TapeModel)
-async def get_tweets(api_key=Header()):
-    try:
-        async with session_factory() as session:
-            await add_user(session, api_key)
-    except IntegrityError:
-        pass
-    async with session_factory() as session:
-        return await Tape.get_tape(session, api_key)
+async def get_tweets(
+    response: Response,
+    if_none_match: str | None = Header(None),
+    user_id: int = Depends(current_user_id),
+    limit: int | None = Query(None, ge=1, le=100),
+    cursor: str | None = None,
+    repository: Repository = Depends(get_repository),
+):
+    await like_buffer.sync(user_id)
+    get_feed = repository.get_timeline if config.FEED_MODE == "push" else repository.get_tape
+    return await versioned(
+        response, if_none_match, versions.feed_etag(user_id),
+        ("feed", user_id, config.FEED_MODE, limit, cursor),
+        partial(get_feed, user_id, limit, cursor),
+        fast_json_tape,
+    )
+
+
+@app.get("/api/search", response_model=TapeModel)
+async def search(
+    q: str = Query(min_length=1, max_length=300),
+    limit: int | None = Query(None, ge=1, le=100),
+    cursor: str | None = None,
+    user_id: int = Depends(current_user_id),
+    repository: Repository = Depends(get_repository),
+):
+    await like_buffer.sync(user_id)
+    return fast_json_tape(await repository.search_tweets(q, limit, cursor))
 
 
 @app.get("/api/users/{id}", response_model=UserProfileModel)
-async def get_other_profile(id: int):
-    async with session_factory() as session:
-        return await Profile.get_user_profile_by_id(session, id)
+async def get_other_profile(
+    id: int,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    repository: Repository = Depends(get_repository),
+):
+    return await versioned(
+        response, if_none_match, versions.profile_etag(id), ("profile", id),
+        partial(repository.get_profile, id), render_profile,
+    )
+
+
+@app.get("/api/users/{id}/followers", response_model=UserListModel)
+async def get_followers(
+    id: int,
+    limit: int | None = Query(None, ge=1, le=100),
+    cursor: str | None = None,
+    repository: Repository = Depends(get_repository),
+):
+    return fast_json(await repository.get_followers(id, limit, cursor))
+
+
+@app.get("/api/users/{id}/following", response_model=UserListModel)
+async def get_following(
+    id: int,
+    limit: int | None = Query(None, ge=1, le=100),
+    cursor: str | None = None,
+    repository: Repository = Depends(get_repository),
+):
+    return fast_json(await repository.get_following(id, limit, cursor))
 
 
 @app.post("/api/users/{id}/follow", response_model=SuccessModel, status_code=201)
-async def follow_(id: int, api_key=Header()):
-    async with session_factory() as session:
-        await follow(session, id, api_key)
-        return {'result': True}
+async def follow_(
+    id: int, user_id: int = Depends(current_user_id), repository: Repository = Depends(get_repository)
+):
+    await repository.follow(id, user_id)
+    versions.follows_changed(id, user_id)
+    return {'result': True}
 
 
 @app.delete("/api/users/{id}/follow", response_model=SuccessModel)
-async def unfollow_(id: int, api_key=Header()):
-    async with session_factory() as session:
-        await unfollow(session, id, api_key)
-        return {"result": True}
+async def unfollow_(
+    id: int, user_id: int = Depends(current_user_id), repository: Repository = Depends(get_repository)
+):
+    await repository.unfollow(id, user_id)
+    versions.follows_changed(id, user_id)
+    return {"result": True}
 
 
 @app.middleware("http")
 async def internal_errors(request: Request, call_next):
+    started, stats = perf_counter(), QueryStats()
+    token = query_stats.set(stats)
+    metrics.http_requests_in_flight.inc(method=request.method)
+    status = 500
     try:
         response = await call_next(request)
+        status = response.status_code
         return response
     except Exception as e:
         sentry_sdk.capture_exception(e)
@@ -169,3 +351,12 @@ async def internal_errors(request: Request, call_next):
             },
             500,
         )
+    finally:
+        query_stats.reset(token)
+        route = request.scope["route"].path if "route" in request.scope else "other"
+        labels = {"method": request.method, "route": route}
+        metrics.http_requests_in_flight.dec(method=request.method)
+        metrics.http_requests.inc(status=status, **labels)
+        metrics.http_request_duration.observe(perf_counter() - started, **labels)
+        metrics.http_request_sql_statements.observe(stats.statements, **labels)
+        metrics.http_request_sql_duration.observe(stats.seconds, **labels)
@@ -0,0 +1,28 @@
+from typing import AsyncIterator
+import orjson
+from fastapi.responses import ORJSONResponse
+from starlette.responses import StreamingResponse
+import config
+
+STREAM_CHUNK = 256
+
+
+def fast_json(payload: dict):
+    if not config.FAST_JSON:
+        return payload
+    return ORJSONResponse(payload)
+
+
+async def _stream_tape(tape: dict) -> AsyncIterator[bytes]:
+    tweets = tape["tweets"]
+    yield b'{"result":true,"tweets":['
+    for start in range(0, len(tweets), STREAM_CHUNK):
+        chunk = b",".join(orjson.dumps(tweet) for tweet in tweets[start:start + STREAM_CHUNK])
+        yield b"," + chunk if start else chunk
+    yield b'],"next_cursor":' + orjson.dumps(tape["next_cursor"]) + b"}"
+
+
+def fast_json_tape(tape: dict):
+    if not config.FAST_JSON or len(tape["tweets"]) < config.JSON_STREAM_THRESHOLD:
+        return fast_json(tape)
+    return StreamingResponse(_stream_tape(tape), media_type="application/json")
@@ -1,9 +1,47 @@
+import asyncio
+import gzip
+import io
+import os
+from contextlib import asynccontextmanager
+from time import monotonic
+from types import SimpleNamespace
+from uuid import uuid4
 import pytest
+from PIL import Image
 from dotenv import find_dotenv, load_dotenv
 load_dotenv(find_dotenv())
 
+from alembic.script import ScriptDirectory
 from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event, make_url, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
+import config
+import main
 from routers import app
+from database.engine import ALEMBIC_INI, engine, run_migrations, session_factory, wait_for_database
+from database.queries import rebuild_timelines, get_user_by_id, repair_counters
+from database.models import Tweet, User
+from media import media_store
+from media.storage import MediaStore
+from media.variants import variant_key
+import database.likes
+from database.likes import LikeBuffer, like_buffer
+from dependencies import get_repository, user_cache
+from repository import Repository, open_repository
+from repository.memory import MemoryRepository
+from caching import response_cache
+from assets import AssetFiles, compressors, precompress
+from tracing import traces_sampler
+
+
+requires_database = pytest.mark.skipif(
+    config.REPOSITORY_BACKEND != "sql", reason="inspects the SQL backend"
+)
 
 
 @pytest.fixture(scope='session')
@@ -32,6 +70,64 @@ def tweet_id(client, image_id):
     yield client.post("/api/tweets", json=tweet).json()['tweet_id']
 
 
+@pytest.fixture
+def legacy_database():
+    url = make_url(os.getenv("BASE"))
+    database = f"{url.database}_legacy"
+    admin = create_async_engine(url, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    legacy = create_async_engine(url.set(database=database), poolclass=NullPool)
+
+    async def create():
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+            await conn.execute(text(f'CREATE DATABASE "{database}"'))
+        await run_migrations(legacy, "0001")
+        async with legacy.begin() as conn:
+            await conn.execute(text("DROP TABLE alembic_version"))
+
+    async def drop():
+        await legacy.dispose()
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+
+    asyncio.run(create())
+    yield legacy
+    asyncio.run(drop())
+
+
+@pytest.fixture
+def push_mode(client, monkeypatch):
+    async def rebuild():
+        async with session_factory() as session:
+            await rebuild_timelines(session)
+
+    monkeypatch.setattr(config, "FEED_MODE", "push")
+    if config.REPOSITORY_BACKEND == "sql":
+        client.portal.call(rebuild)
+    yield
+
+
+@pytest.fixture
+def buffered_likes(client, monkeypatch):
+    monkeypatch.setattr(config, "LIKE_BUFFER", True)
+    monkeypatch.setattr(like_buffer, "interval", 60000)
+    client.portal.call(like_buffer.start)
+    yield like_buffer
+    client.portal.call(like_buffer.stop)
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+
 ########################################################################################################################
 
 
@@ -99,3 +195,791 @@ async def test_follow(client, other_user_id):
 async def test_unfollow(client, other_user_id):
     response = client.delete(f"/api/users/{other_user_id}/follow")
     assert response.status_code == 200
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_tape_statements_do_not_grow_with_feed(client, statements, other_user_id):
+    client.get("/api/tweets")
+    statements.clear()
+    client.get("/api/tweets")
+    small_feed = len(statements)
+
+    for _ in range(10):
+        tweet = client.post("/api/tweets", json={"tweet_data": "hello", "tweet_media_ids": []}).json()
+        client.post(f"/api/tweets/{tweet['tweet_id']}/likes", headers={"api-key": "test2"})
+    client.post(f"/api/users/{other_user_id}/follow")
+    statements.clear()
+    response = client.get("/api/tweets")
+
+    assert response.status_code == 200
+    assert len(response.json()["tweets"]) >= 10
+    assert len(statements) == small_feed <= 5
+
+
+@pytest.mark.asyncio
+async def test_tape_pages_match_full_tape(client, tweet_id):
+    full_tape = client.get("/api/tweets").json()
+    assert full_tape["next_cursor"] is None
+
+    paged, cursor = [], None
+    while True:
+        params = {"limit": 3} | ({"cursor": cursor} if cursor else {})
+        page = client.get("/api/tweets", params=params).json()
+        assert len(page["tweets"]) <= 3
+        paged.extend(page["tweets"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert paged == full_tape["tweets"]
+
+
+@pytest.mark.asyncio
+async def test_tape_invalid_cursor(client):
+    response = client.get("/api/tweets", params={"cursor": "???"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_timeline_fan_out(client, push_mode, other_user_id):
+    other = {"api-key": "test2"}
+    own_id = client.post("/api/tweets", json={"tweet_data": "own", "tweet_media_ids": []}).json()["tweet_id"]
+    client.delete(f"/api/users/{other_user_id}/follow")
+    before_follow = client.post("/api/tweets", json={"tweet_data": "a", "tweet_media_ids": []}, headers=other)
+    before_follow = before_follow.json()["tweet_id"]
+
+    def timeline_ids():
+        return [tweet["id"] for tweet in client.get("/api/tweets").json()["tweets"]]
+
+    assert own_id in timeline_ids() and before_follow not in timeline_ids()
+
+    client.post(f"/api/users/{other_user_id}/follow")
+    after_follow = client.post("/api/tweets", json={"tweet_data": "b", "tweet_media_ids": []}, headers=other)
+    after_follow = after_follow.json()["tweet_id"]
+    ids = timeline_ids()
+    assert {own_id, before_follow, after_follow} <= set(ids)
+    assert ids == sorted(ids, reverse=True)
+
+    client.delete(f"/api/tweets/{after_follow}", headers=other)
+    assert after_follow not in timeline_ids()
+
+    client.delete(f"/api/users/{other_user_id}/follow")
+    assert before_follow not in timeline_ids() and own_id in timeline_ids()
+
+    me = client.get("/api/users/me").json()["user"]["id"]
+    client.post(f"/api/users/{me}/follow")
+    client.delete(f"/api/users/{me}/follow")
+    assert own_id in timeline_ids()
+
+
+@pytest.mark.asyncio
+async def test_self_follower_can_tweet_in_push_mode(client, push_mode):
+    me = client.get("/api/users/me").json()["user"]["id"]
+    client.post(f"/api/users/{me}/follow")
+    try:
+        response = client.post("/api/tweets", json={"tweet_data": "self", "tweet_media_ids": []})
+        assert response.status_code == 201
+        tweet_ids = [tweet["id"] for tweet in client.get("/api/tweets").json()["tweets"]]
+        assert tweet_ids.count(response.json()["tweet_id"]) == 1
+    finally:
+        client.delete(f"/api/users/{me}/follow")
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_user_cache(client, statements):
+    headers = {"api-key": "cached"}
+    user_cache.invalidate("cached")
+    hits, misses = user_cache.hits, user_cache.misses
+
+    me = client.get("/api/users/me", headers=headers).json()["user"]
+    assert (user_cache.hits, user_cache.misses) == (hits, misses + 1)
+
+    statements.clear()
+    assert client.get("/api/users/me", headers=headers).json()["user"]["id"] == me["id"]
+    assert (user_cache.hits, user_cache.misses) == (hits + 1, misses + 1)
+    assert not any("api_key = " in statement for statement in statements)
+
+    user_cache.invalidate_user(me["id"])
+    assert client.get("/api/users/me", headers=headers).json()["user"]["id"] == me["id"]
+    assert user_cache.misses == misses + 2
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_one_connection_per_request(client, image_id, other_user_id):
+    pool = engine.pool
+    assert pool.size() == config.DB_POOL_SIZE
+    client.get("/api/users/me")
+    for method, url in (
+        ("get", "/api/users/me"),
+        ("get", "/api/tweets"),
+        ("get", f"/api/users/{other_user_id}"),
+        ("post", f"/api/users/{other_user_id}/follow"),
+        ("delete", f"/api/users/{other_user_id}/follow"),
+        ("get", f"/{image_id}"),
+    ):
+        checkouts = pool.stats()["checkouts"]
+        getattr(client, method)(url)
+        stats = pool.stats()
+        assert stats["checkouts"] - checkouts <= 1, url
+        assert stats["checked_out"] == 0, url
+
+
+@pytest.mark.asyncio
+async def test_concurrent_tapes(client):
+    async def own_tape(http: AsyncClient, api_key: str):
+        headers = {"api-key": api_key}
+        user_id = (await http.get("/api/users/me", headers=headers)).json()["user"]["id"]
+        await http.post("/api/tweets", json={"tweet_data": api_key, "tweet_media_ids": []}, headers=headers)
+        tape = (await http.get("/api/tweets", params={"limit": 1}, headers=headers)).json()["tweets"]
+        return api_key, user_id, tape
+
+    async def stress():
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as http:
+            return await asyncio.gather(*(own_tape(http, f"concurrent-{i}") for i in range(200)))
+
+    for api_key, user_id, tape in client.portal.call(stress):
+        assert tape[0]["content"] == api_key
+        assert tape[0]["author"]["id"] == user_id
+
+
+@pytest.mark.asyncio
+async def test_duplicate_images_stored_once(client, image_id):
+    async def load(media_id):
+        async with open_repository() as repository:
+            return await repository.get_image(media_id)
+
+    with open("33584.jpg", "rb") as file:
+        content = file.read()
+    duplicate_id = client.post("/api/medias", files={"file": ("33584.jpg", content, "image/jpeg")}).json()["media_id"]
+    image, duplicate = client.portal.call(load, image_id), client.portal.call(load, duplicate_id)
+
+    assert duplicate_id != image_id
+    assert image.image is None and image.sha256 == duplicate.sha256
+    assert duplicate.size == len(content) and duplicate.mime_type == "image/jpeg"
+    assert client.portal.call(media_store.read, duplicate.sha256) == content
+    assert client.get(f"/{duplicate_id}").content == content
+
+
+@pytest.mark.asyncio
+async def test_get_image_caching(client, image_id):
+    with open("33584.jpg", "rb") as file:
+        content = file.read()
+
+    response = client.get(f"/{image_id}")
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    assert client.get(f"/{image_id}", headers={"if-none-match": etag}).status_code == 304
+
+    partial = client.get(f"/{image_id}", headers={"range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == content[10:20]
+    assert partial.headers["content-range"] == f"bytes 10-19/{len(content)}"
+
+    suffix = client.get(f"/{image_id}", headers={"range": "bytes=-5"})
+    assert suffix.status_code == 206 and suffix.content == content[-5:]
+
+    unsatisfiable = client.get(f"/{image_id}", headers={"range": f"bytes={len(content)}-"})
+    assert unsatisfiable.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_load_image_too_large(client, monkeypatch):
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE", 1024)
+    body = b"\xff\xd8\xff" + b"\x00" * 4096
+    response = client.post("/api/medias", files={"file": ("big.jpg", body, "image/jpeg")})
+    assert response.status_code == 413
+
+    def chunks():
+        yield b"--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.jpg\"\r\n\r\n"
+        for _ in range(4):
+            yield body
+        yield b"\r\n--x--\r\n"
+
+    response = client.post("/api/medias", content=chunks(), headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+    assert not list(media_store.root.glob(".upload-*"))
+
+
+@pytest.mark.asyncio
+async def test_load_image_without_file(client):
+    response = client.post("/api/medias", files={"other": ("a.jpg", b"data", "image/jpeg")})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_unknown_media(client):
+    response = client.get("/2147483647")
+    assert response.status_code == 404 and response.json()["error_type"] == "NotFound"
+    assert client.get("/2147483647", params={"size": 256}).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_like_unknown_tweet(client):
+    assert client.post("/api/tweets/2147483647/likes").status_code == 201
+    assert client.post("/api/tweets/2147483647/likes").status_code == 201
+    assert client.delete("/api/tweets/2147483647/likes").status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_unknown_user(client):
+    response = client.get("/api/users/2147483647")
+    assert response.status_code == 404 and response.json()["error_type"] == "NotFound"
+    for relation in ("followers", "following"):
+        response = client.get(f"/api/users/2147483647/{relation}")
+        assert response.status_code == 200
+        assert response.json() == {"result": True, "users": [], "next_cursor": None}
+
+
+@pytest.mark.asyncio
+async def test_image_variants(client, image_id):
+    async def load():
+        async with open_repository() as repository:
+            return await repository.get_image(image_id)
+
+    with open("33584.jpg", "rb") as file:
+        media_id = client.post("/api/medias", files={"file": file}).json()["media_id"]
+    digest = client.portal.call(load).sha256
+    assert client.portal.call(media_store.exists, variant_key(digest, 256))
+
+    media_store.path(variant_key(digest, 256)).unlink()
+    response = client.get(f"/{media_id}", params={"size": 256})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert max(Image.open(io.BytesIO(response.content)).size) <= 256
+    assert client.portal.call(media_store.exists, variant_key(digest, 256))
+
+    assert client.get(f"/{media_id}", params={"size": 300}).status_code == 400
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_counters(client):
+    async def counters(user_ids, tweet_id):
+        async with session_factory() as session:
+            users = [await get_user_by_id(session, user_id) for user_id in user_ids]
+            tweet = await session.get(Tweet, tweet_id)
+            return [(user.followers_count, user.following_count) for user in users], tweet.likes_count
+
+    async def repair():
+        async with session_factory() as session:
+            await session.execute(update(Tweet).where(Tweet.id == tweet_id).values(likes_count=100))
+            await repair_counters(session)
+
+    star, fan = {"api-key": "counters-star"}, {"api-key": "counters-fan"}
+    star_id = client.get("/api/users/me", headers=star).json()["user"]["id"]
+    fan_id = client.get("/api/users/me", headers=fan).json()["user"]["id"]
+    tweet_id = client.post("/api/tweets", json={"tweet_data": "star", "tweet_media_ids": []}, headers=star)
+    tweet_id = tweet_id.json()["tweet_id"]
+
+    client.post(f"/api/users/{star_id}/follow", headers=fan)
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    assert client.portal.call(counters, [star_id, fan_id], tweet_id) == ([(1, 0), (0, 1)], 1)
+
+    client.portal.call(repair)
+    assert client.portal.call(counters, [star_id, fan_id], tweet_id) == ([(1, 0), (0, 1)], 1)
+
+    client.post(f"/api/users/{star_id}/follow", headers=fan)
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    assert client.portal.call(counters, [star_id, fan_id], tweet_id) == ([(1, 0), (0, 1)], 1)
+
+    for _ in range(2):
+        client.delete(f"/api/users/{star_id}/follow", headers=fan)
+        client.delete(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    assert client.portal.call(counters, [star_id, fan_id], tweet_id) == ([(0, 0), (0, 0)], 0)
+
+
+@requires_database
+@pytest.mark.asyncio
+@pytest.mark.parametrize("feed_mode", ("pull", "push"))
+async def test_writes_are_single_statement(client, statements, other_user_id, feed_mode, monkeypatch):
+    monkeypatch.setattr(config, "FEED_MODE", feed_mode)
+    client.get("/api/users/me")
+    tweet_id = client.post("/api/tweets", json={"tweet_data": "single", "tweet_media_ids": []}).json()["tweet_id"]
+    for method, url in (
+        ("post", f"/api/tweets/{tweet_id}/likes"),
+        ("delete", f"/api/tweets/{tweet_id}/likes"),
+        ("post", f"/api/users/{other_user_id}/follow"),
+        ("delete", f"/api/users/{other_user_id}/follow"),
+        ("delete", f"/api/tweets/{tweet_id}"),
+    ):
+        statements.clear()
+        getattr(client, method)(url)
+        assert len(statements) == 1, url
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_concurrent_inserts_return_own_ids(client):
+    async def create(http: AsyncClient, api_key: str):
+        headers = {"api-key": api_key}
+        user_id = (await http.get("/api/users/me", headers=headers)).json()["user"]["id"]
+        tweet = {"tweet_data": api_key, "tweet_media_ids": []}
+        tweet_id = (await http.post("/api/tweets", json=tweet, headers=headers)).json()["tweet_id"]
+        return api_key, user_id, tweet_id
+
+    async def stress():
+        user_cache.clear()
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as http:
+            return await asyncio.gather(*(create(http, f"returning-{i % 50}") for i in range(200)))
+
+    async def load(tweet_ids):
+        async with session_factory() as session:
+            return {tweet.id: tweet for tweet in (await session.execute(select(Tweet).where(Tweet.id.in_(tweet_ids)))).scalars()}
+
+    created = client.portal.call(stress)
+    tweets = client.portal.call(load, [tweet_id for _, _, tweet_id in created])
+
+    assert len(tweets) == len(created)
+    assert len({user_id for _, user_id, _ in created}) == 50
+    for api_key, user_id, tweet_id in created:
+        assert (tweets[tweet_id].content, tweets[tweet_id].user_id) == (api_key, user_id)
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_buffered_likes(client, buffered_likes, statements, monkeypatch):
+    async def likes_count(tweet_id):
+        async with session_factory() as session:
+            return (await session.get(Tweet, tweet_id, populate_existing=True)).likes_count
+
+    async def wait_for_flush(flushes):
+        while buffered_likes.flushes == flushes:
+            await asyncio.sleep(0.01)
+
+    fans = [{"api-key": f"buffered-{i}"} for i in range(3)]
+    for fan in fans:
+        client.get("/api/users/me", headers=fan)
+    tweet_id = client.post("/api/tweets", json={"tweet_data": "buffered", "tweet_media_ids": []}).json()["tweet_id"]
+
+    statements.clear()
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fans[0])
+    client.delete(f"/api/tweets/{tweet_id}/likes", headers=fans[0])
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fans[0])
+    assert not statements and client.portal.call(likes_count, tweet_id) == 0
+
+    flushes = buffered_likes.flushes
+    client.get("/api/tweets", headers=fans[0])
+    assert buffered_likes.flushes == flushes + 1 and buffered_likes.last_flush_size == 1
+    assert client.portal.call(likes_count, tweet_id) == 1
+
+    monkeypatch.setattr(buffered_likes, "size", 2)
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fans[1])
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fans[2])
+    client.portal.call(wait_for_flush, flushes + 1)
+    assert buffered_likes.last_flush_size == 2
+    assert client.portal.call(likes_count, tweet_id) == 3
+
+    client.delete(f"/api/tweets/{tweet_id}/likes", headers=fans[1])
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fans[1])
+    client.delete(f"/api/tweets/{tweet_id}/likes", headers=fans[2])
+    client.post("/api/tweets/999999999/likes", headers=fans[2])
+    client.portal.call(buffered_likes.stop)
+    assert client.portal.call(likes_count, tweet_id) == 2
+    assert buffered_likes.flushed >= 5
+
+
+def patch_likes_repository(monkeypatch, apply_likes):
+    @asynccontextmanager
+    async def open_likes_repository():
+        yield SimpleNamespace(apply_likes=apply_likes)
+
+    monkeypatch.setattr(database.likes, "open_repository", open_likes_repository)
+
+
+@pytest.mark.asyncio
+async def test_like_buffer_sync_waits_for_flush(monkeypatch):
+    release, written = asyncio.Event(), []
+
+    async def apply_likes(changes):
+        await release.wait()
+        written.append(changes)
+
+    patch_likes_repository(monkeypatch, apply_likes)
+    buffer = LikeBuffer(60000, 500)
+    buffer.add(1, 7, True)
+    flushing = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0.01)
+    syncing = asyncio.create_task(buffer.sync(7))
+    await asyncio.sleep(0.01)
+    assert buffer.pending(7) and not syncing.done()
+
+    release.set()
+    await asyncio.wait_for(syncing, 1)
+    await flushing
+    assert written == [{(1, 7): True}] and not buffer.pending(7)
+
+
+@pytest.mark.asyncio
+async def test_like_buffer_keeps_failed_flush(monkeypatch):
+    written = []
+
+    async def apply_likes(changes):
+        if not buffer.failures:
+            buffer.add(1, 7, False)
+            raise ConnectionError("database went away")
+        written.append(changes)
+
+    patch_likes_repository(monkeypatch, apply_likes)
+    buffer = LikeBuffer(60000, 500)
+    buffer.add(1, 7, True)
+    buffer.add(2, 7, True)
+    await buffer.flush()
+    assert buffer.failures == 1 and buffer.flushes == 0 and buffer.pending(7)
+
+    await buffer.flush()
+    assert written == [{(1, 7): False, (2, 7): True}] and not buffer.pending(7)
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_metrics(client, statements):
+    def samples():
+        text = client.get("/metrics").text
+        return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+    labels = '{method="GET",route="/api/tweets"}'
+    before = samples()
+    statements.clear()
+    client.get("/api/tweets", params={"limit": 5})
+    executed = len(statements)
+    after = samples()
+
+    def delta(name):
+        return float(after[name]) - float(before.get(name, 0))
+
+    assert delta('http_requests_total{method="GET",route="/api/tweets",status="200"}') == 1
+    assert delta(f"http_request_duration_seconds_count{labels}") == 1
+    assert delta(f"http_request_sql_statements_sum{labels}") == executed > 0
+    assert delta(f"http_request_sql_seconds_sum{labels}") > 0
+    assert after['http_requests_in_flight{method="GET"}'] == "1"
+    assert float(after["db_pool_checkouts_total"]) > 0
+    assert client.get("/metrics").headers["content-type"].startswith("text/plain")
+
+
+@pytest.mark.asyncio
+async def test_traces_sampler(monkeypatch):
+    monkeypatch.setattr(config, "SENTRY_TRACES_SAMPLE_RATE", 0.5)
+    monkeypatch.setattr(config, "SENTRY_ROUTE_SAMPLE_RATES", {"/api/tweets": 0.01, "/api/tweets/": 0.2, "/metrics": 0})
+
+    def rate(path, **context):
+        return traces_sampler({"asgi_scope": {"path": path}, **context})
+
+    assert rate("/api/tweets") == 0.01
+    assert rate("/api/tweets/1/likes") == 0.2
+    assert rate("/metrics") == 0
+    assert rate("/api/users/me") == 0.5
+    assert rate("/api/tweets", parent_sampled=True) == 1
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint(client, monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+
+    assert client.get("/admin/profile", params={"seconds": 0.1}).status_code == 403
+    assert client.get("/admin/profile", params={"seconds": 0.1}, headers={"admin-token": "wrong"}).status_code == 403
+    assert client.get("/admin/profile", params={"seconds": 3600}, headers={"admin-token": "secret"}).status_code == 422
+
+    response = client.get("/admin/profile", params={"seconds": 0.1}, headers={"admin-token": "secret"})
+    assert response.status_code == 200
+    stacks = [line.rsplit(" ", 1) for line in response.text.splitlines()]
+    assert stacks and all(int(count) > 0 for _, count in stacks)
+    assert any("asyncio.base_events:run_forever" in stack for stack, _ in stacks)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("threshold", (1000, 1))
+async def test_fast_json(client, tweet_id, other_user_id, threshold, monkeypatch):
+    urls = ("/api/tweets", "/api/users/me", f"/api/users/{other_user_id}")
+    expected = [client.get(url).json() for url in urls]
+
+    monkeypatch.setattr(config, "FAST_JSON", True)
+    monkeypatch.setattr(config, "JSON_STREAM_THRESHOLD", threshold)
+    assert [client.get(url).json() for url in urls] == expected
+    assert client.get("/api/tweets").headers["content-type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_health_checks(client):
+    assert client.get("/healthz").json() == {"result": True}
+    assert client.get("/readyz").json() == {"result": True}
+    assert float(dict(
+        line.rsplit(" ", 1) for line in client.get("/metrics").text.splitlines() if not line.startswith("#")
+    )["cold_start_seconds"]) > 0
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_wait_for_database(client):
+    assert client.portal.call(wait_for_database, 1) == 1
+
+    unreachable = create_async_engine("postgresql+asyncpg://nobody@/nowhere?host=/nonexistent")
+    started = monotonic()
+    with pytest.raises(OSError):
+        await wait_for_database(0.5, unreachable)
+    assert monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_follow_lists(client, monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_PAGE_SIZE", 2)
+    star = client.get("/api/users/me", headers={"api-key": "lists-star"}).json()["user"]["id"]
+    fans = [client.get("/api/users/me", headers={"api-key": f"lists-fan-{i}"}).json()["user"]["id"] for i in range(5)]
+    for i in range(5):
+        client.post(f"/api/users/{star}/follow", headers={"api-key": f"lists-fan-{i}"})
+
+    profile = client.get(f"/api/users/{star}").json()["user"]
+    assert profile["followers"] == [{"id": fan, "name": "User"} for fan in fans[:2]]
+    assert (profile["followers_count"], profile["following_count"]) == (5, 0)
+    assert profile["following"] == [] and profile["following_next_cursor"] is None
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        page = client.get(f"/api/users/{star}/followers", params=params).json()
+        pages.append([user["id"] for user in page["users"]])
+        if (cursor := page["next_cursor"]) is None:
+            break
+    assert pages == [fans[:2], fans[2:4], fans[4:]]
+    resumed = client.get(f"/api/users/{star}/followers", params={"cursor": profile["followers_next_cursor"]})
+    assert [user["id"] for user in resumed.json()["users"]] == fans[2:]
+
+    following = client.get(f"/api/users/{fans[0]}/following").json()
+    assert following == {"result": True, "users": [{"id": star, "name": "User"}], "next_cursor": None}
+    assert client.get(f"/api/users/{star}/following", params={"cursor": "bad"}).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_search(client):
+    headers, word = {"api-key": "search-author"}, f"w{uuid4().hex}"
+    contents = [f"{word} once", f"{word} {word} twice", "unrelated", f"{word.upper()} again", f"{word} moon"]
+    ids = [
+        client.post("/api/tweets", json={"tweet_data": content, "tweet_media_ids": []}, headers=headers).json()["tweet_id"]
+        for content in contents
+    ]
+
+    pages, cursor = [], None
+    while True:
+        params = {"q": word, "limit": 2} if cursor is None else {"q": word, "limit": 2, "cursor": cursor}
+        page = client.get("/api/search", params=params).json()
+        pages.append([tweet["id"] for tweet in page["tweets"]])
+        if (cursor := page["next_cursor"]) is None:
+            break
+    assert pages == [[ids[1], ids[4]], [ids[3], ids[0]]]
+
+    found = client.get("/api/search", params={"q": f"{word} moon"}).json()
+    assert found["tweets"] == [
+        {"id": ids[4], "content": f"{word} moon", "attachments": [], "author": found["tweets"][0]["author"], "likes": []}
+    ]
+    assert client.get("/api/search", params={"q": word, "cursor": "bad"}).status_code == 400
+    assert client.get("/api/search").status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(client, statements, other_user_id, monkeypatch):
+    monkeypatch.setattr(config, "CONDITIONAL_GET", True)
+    etag = client.get("/api/tweets", params={"limit": 5}).headers["etag"]
+    profile_etag = client.get(f"/api/users/{other_user_id}").headers["etag"]
+    assert etag.startswith('W/"') and etag != profile_etag
+
+    statements.clear()
+    cached = client.get("/api/tweets", params={"limit": 5}, headers={"if-none-match": etag})
+    assert cached.status_code == 304 and cached.headers["etag"] == etag and not statements
+    assert client.get(f"/api/users/{other_user_id}", headers={"if-none-match": profile_etag}).status_code == 304
+
+    tweet = {"tweet_data": "conditional", "tweet_media_ids": []}
+    client.post("/api/tweets", json=tweet, headers={"api-key": "test_user_2"})
+    changed = client.get("/api/tweets", params={"limit": 5}, headers={"if-none-match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert client.get(f"/api/users/{other_user_id}", headers={"if-none-match": profile_etag}).status_code == 304
+
+    client.post(f"/api/users/{other_user_id}/follow")
+    client.delete(f"/api/users/{other_user_id}/follow")
+    assert client.get(f"/api/users/{other_user_id}", headers={"if-none-match": profile_etag}).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_response_cache(client, statements, other_user_id, monkeypatch):
+    monkeypatch.setattr(response_cache, "maxsize", 2)
+    response_cache.clear()
+    profile = client.get(f"/api/users/{other_user_id}").json()
+    statements.clear()
+    assert client.get(f"/api/users/{other_user_id}").json() == profile and not statements
+    assert response_cache.hits >= 1
+
+    client.post(f"/api/users/{other_user_id}/follow")
+    followed = client.get(f"/api/users/{other_user_id}").json()["user"]
+    assert followed["followers_count"] == profile["user"]["followers_count"] + 1
+    client.delete(f"/api/users/{other_user_id}/follow")
+
+    client.get("/api/tweets", params={"limit": 5})
+    client.get("/api/tweets", params={"limit": 6})
+    assert len(response_cache) == 2
+    response_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_static_assets(tmp_path):
+    script = "console.log('hashed');\n" * 200
+    (tmp_path / "app.0123abcd.js").write_text(script)
+    (tmp_path / "app.0123abcd.js.map").write_text("{}" * 1000)
+    (tmp_path / "plain.js").write_text(script)
+    assert precompress(str(tmp_path)) == 2 * len(compressors())
+    assert precompress(str(tmp_path)) == 0
+
+    assets = TestClient(Starlette(routes=[Mount("/", AssetFiles(directory=str(tmp_path)))]))
+    compressed = assets.get("/app.0123abcd.js", headers={"accept-encoding": "gzip"})
+    assert compressed.text == script and compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["content-type"].startswith("text/javascript")
+    assert compressed.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    identity = assets.get("/app.0123abcd.js", headers={"accept-encoding": "gzip;q=0"})
+    assert identity.text == script and "content-encoding" not in identity.headers
+    assert assets.get("/plain.js").headers["cache-control"] == "no-cache"
+    assert assets.get("/app.0123abcd.js.map").status_code == 404
+    (tmp_path / "app.0123abcd.js.map.gz").write_bytes(gzip.compress(b"{}"))
+    assert assets.get("/app.0123abcd.js.map", headers={"accept-encoding": "gzip"}).status_code == 404
+    assert assets.get("/app.0123abcd.js.map.gz").status_code == 404
+    assert assets.get("/app.0123abcd.js.gz").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_index_page(client):
+    page = client.get("/", headers={"accept-encoding": "gzip"})
+    assert page.headers["content-encoding"] == "gzip" and page.headers["cache-control"] == "no-cache"
+    assert '<div id="app">' in page.text
+    cached = client.get("/", headers={"if-none-match": page.headers["etag"]})
+    assert cached.status_code == 304 and not cached.content
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_upgrades_baseline_database(legacy_database):
+    async with legacy_database.begin() as conn:
+        await conn.execute(text("""INSERT INTO "user" (id, name, api_key) VALUES (1, 'old', 'legacy')"""))
+        await conn.execute(text("INSERT INTO tweet (id, user_id, content) VALUES (1, 1, 'old tweet')"))
+        await conn.execute(text("INSERT INTO tweet_like (tweet_id, user_id) VALUES (1, 1)"))
+        await conn.execute(text("INSERT INTO image (id, image) VALUES (1, 'blob')"))
+
+    await run_migrations(legacy_database)
+    await run_migrations(legacy_database)
+
+    async with legacy_database.connect() as conn:
+        head = ScriptDirectory(str(ALEMBIC_INI.parent / "migrations")).get_current_head()
+        assert (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar() == head
+        assert (await conn.execute(text("SELECT to_regclass('subscription')"))).scalar() is None
+        assert (await conn.execute(text("SELECT likes_count FROM tweet"))).scalar() == 1
+        assert (await conn.execute(text("SELECT count(*) FROM timeline"))).scalar() == 0
+        image = (await conn.execute(text("SELECT image, sha256 FROM image"))).one()
+        assert (bytes(image.image), image.sha256) == (b"blob", None)
+        search = text("SELECT id FROM tweet WHERE search @@ to_tsquery('simple', 'old')")
+        assert (await conn.execute(search)).scalar() == 1
+
+
+@requires_database
+@pytest.mark.asyncio
+async def test_merges_legacy_follow_tables(legacy_database):
+    async with legacy_database.begin() as conn:
+        await conn.execute(text("""INSERT INTO "user" (id, api_key) VALUES (1, 'a'), (2, 'b'), (3, 'c')"""))
+        # subscription (user_id, subscription_id): subscription_id follows user_id
+        await conn.execute(text("INSERT INTO subscription (user_id, subscription_id) VALUES (1, 2), (3, 1), (1, 3)"))
+        # follower (user_id, follower_id): user_id follows follower_id
+        await conn.execute(text("INSERT INTO follower (user_id, follower_id) VALUES (2, 1), (3, 2)"))
+
+    await run_migrations(legacy_database)
+
+    async with legacy_database.connect() as conn:
+        edges = await conn.execute(text("SELECT follower_id, followee_id FROM follow"))
+        assert set(edges.all()) == {(2, 1), (1, 3), (3, 1), (3, 2)}
+        counters = await conn.execute(text('SELECT id, followers_count, following_count FROM "user" ORDER BY id'))
+        assert counters.all() == [(1, 2, 1), (2, 1, 1), (3, 1, 2)]
+
+    async with async_sessionmaker(legacy_database)() as session:
+        users = (
+            await session.execute(
+                select(User).options(selectinload(User.subscriptions), selectinload(User.followers)).order_by(User.id)
+            )
+        ).scalars().all()
+        assert [sorted(u.id for u in user.subscriptions) for user in users] == [[3], [1], [1, 2]]
+        assert [sorted(u.id for u in user.followers) for user in users] == [[2, 3], [3], [1]]
+
+
+def test_docker_startup_migrates_once(monkeypatch):
+    launched = {}
+
+    async def prepare():
+        launched["prepared"] = True
+
+    monkeypatch.setattr(main, "prepare", prepare)
+    monkeypatch.setattr(main.uvicorn, "run", lambda app, **options: launched.update(options))
+    monkeypatch.setattr(config, "REPOSITORY_BACKEND", "sql")
+    monkeypatch.setattr(config, "STATIC_PRECOMPRESS", False)
+    monkeypatch.setattr(config, "MIGRATE_ON_STARTUP", True)
+    monkeypatch.setenv("MIGRATE_ON_STARTUP", "1")
+    monkeypatch.setenv("STARTED_AT", "0")
+    main.docker_startup()
+
+    assert launched["prepared"] and launched["workers"] == config.WORKERS
+    assert config.MIGRATE_ON_STARTUP is False and os.environ["MIGRATE_ON_STARTUP"] == "0"
+
+
+@pytest.mark.asyncio
+async def test_only_invalid_cursors_are_bad_requests(client):
+    class BrokenRepository(MemoryRepository):
+        async def get_followers(self, user_id, limit=None, cursor=None):
+            raise ValueError("unrelated")
+
+    app.dependency_overrides[get_repository] = BrokenRepository
+    try:
+        response = client.get("/api/users/1/followers")
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 500
+
+    invalid = client.get("/api/users/1/followers", params={"cursor": "bad"})
+    assert invalid.status_code == 400 and invalid.json()["error_type"] == "ValidationException"
+
+
+@pytest.mark.parametrize("interface", [Repository, MediaStore])
+def test_incomplete_backends_fail_on_creation(interface):
+    class Incomplete(interface):
+        pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
+
+
+@pytest.mark.parametrize("workers, enabled", [(1, True), (4, False)])
+def test_docker_startup_disables_process_caches(monkeypatch, workers, enabled):
+    monkeypatch.setattr(main.uvicorn, "run", lambda app, **options: None)
+    monkeypatch.setattr(config, "REPOSITORY_BACKEND", "memory")
+    monkeypatch.setattr(config, "STATIC_PRECOMPRESS", False)
+    monkeypatch.setattr(config, "WORKERS", workers)
+    monkeypatch.setattr(config, "CONDITIONAL_GET", True)
+    monkeypatch.setattr(config, "RESPONSE_CACHE_SIZE", 100)
+    monkeypatch.setattr(config, "LIKE_BUFFER", True)
+    monkeypatch.setenv("CONDITIONAL_GET", "1")
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "100")
+    monkeypatch.setenv("LIKE_BUFFER", "1")
+    monkeypatch.setenv("STARTED_AT", "0")
+    main.docker_startup()
+
+    assert config.CONDITIONAL_GET is enabled and bool(config.RESPONSE_CACHE_SIZE) is enabled
+    assert os.environ["CONDITIONAL_GET"] == os.environ["LIKE_BUFFER"] == ("1" if enabled else "0")
+    assert config.LIKE_BUFFER is enabled
+
+
+@pytest.mark.asyncio
+async def test_search_sees_own_buffered_likes(client, buffered_likes):
+    word = f"w{uuid4().hex}"
+    tweet_id = client.post("/api/tweets", json={"tweet_data": word, "tweet_media_ids": []}).json()["tweet_id"]
+    fan = {"api-key": "buffered-search-fan"}
+    fan_id = client.get("/api/users/me", headers=fan).json()["user"]["id"]
+    client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+
+    found = client.get("/api/search", params={"q": word}, headers=fan).json()["tweets"]
+    assert [like["user_id"] for like in found[0]["likes"]] == [fan_id]
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import pytest
+from dotenv import find_dotenv, load_dotenv
+load_dotenv(find_dotenv())
+
+from sqlalchemy import event, make_url, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from sqlalchemy.pool import NullPool
+import config
+from benchmarks.seed import API_KEY_PREFIX, seed_statements
+from database import queries
+from database.engine import run_migrations
+from database.models import Tweet
+
+pytestmark = pytest.mark.skipif(config.REPOSITORY_BACKEND != "sql", reason="explains SQL statements")
+
+LARGE_TABLES = {"user", "tweet", "tweet_like", "follow", "timeline"}
+USERS, TWEETS = 20000, 200000
+FRESH_USER = USERS + 1
+
+SEED = seed_statements(USERS, TWEETS, follows=USERS * 5, likes=TWEETS, alpha=3) + (
+    f"""INSERT INTO timeline (user_id, tweet_id)
+        SELECT 1 + floor(random() * {USERS})::int, 1 + floor(random() * {TWEETS})::int
+        FROM generate_series(1, {TWEETS}) ON CONFLICT DO NOTHING""",
+    """INSERT INTO "user" (name, api_key) VALUES ('fresh', 'plan-fresh')""",
+    f"""INSERT INTO tweet (user_id, content, attachments) VALUES ({FRESH_USER}, 'fresh', '{{}}')""",
+    """INSERT INTO image (sha256, size, mime_type) VALUES (repeat('0', 64), 0, 'image/png')""",
+)
+
+CASES = {
+    "get_user_id_by_api_key": lambda session: queries.get_user_id_by_api_key(session, f"{API_KEY_PREFIX}42"),
+    "tape_first_page": lambda session: queries.Tape.get_tape(session, 1, limit=20),
+    "tape_ranked_page": lambda session: queries.Tape.get_tape(
+        session, 1, cursor=queries.encode_cursor((0, 1, TWEETS))
+    ),
+    "tape_tail_page": lambda session: queries.Tape.get_tape(
+        session, FRESH_USER, cursor=queries.encode_cursor((1, USERS // 2, TWEETS))
+    ),
+    "timeline_page": lambda session: queries.Timeline.get_timeline(session, 1, limit=20),
+    "profile": lambda session: queries.Profile.get_user_profile_by_id(session, USERS // 2),
+    "followers_page": lambda session: queries.Relations.get_followers(
+        session, 1, cursor=queries.encode_cursor((USERS // 2,))
+    ),
+    "following_page": lambda session: queries.Relations.get_following(session, 1),
+    "search": lambda session: queries.Search.search_tweets(session, "fresh"),
+    "load_tweet": lambda session: queries.load_tweet(
+        session, FRESH_USER, Tweet.TweetSchema(tweet_data="plan", tweet_media_ids=[])
+    ),
+    "like": lambda session: queries.like(session, TWEETS + 1, FRESH_USER),
+    "unlike": lambda session: queries.unlike(session, TWEETS + 1, FRESH_USER),
+    "follow": lambda session: queries.follow(session, 1, FRESH_USER),
+    "unfollow": lambda session: queries.unfollow(session, 1, FRESH_USER),
+    "get_image": lambda session: queries.get_image(session, 1),
+    "delete_tweet": lambda session: queries.delete_tweet(session, TWEETS + 1, FRESH_USER),
+}
+
+
+@pytest.fixture(scope="module")
+def plan_engine():
+    url = make_url(os.getenv("BASE"))
+    database = f"{url.database}_query_plans"
+    admin = create_async_engine(url, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    plan = create_async_engine(url.set(database=database), poolclass=NullPool)
+
+    async def create():
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+            await conn.execute(text(f'CREATE DATABASE "{database}"'))
+        await run_migrations(plan)
+        async with plan.begin() as conn:
+            for statement in SEED:
+                await conn.execute(text(statement))
+        async with async_sessionmaker(plan)() as session:
+            await queries.repair_counters(session)
+        async with plan.connect() as conn:
+            await (await conn.execution_options(isolation_level="AUTOCOMMIT")).execute(text("ANALYZE"))
+
+    async def drop():
+        await plan.dispose()
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+
+    asyncio.run(create())
+    yield plan
+    asyncio.run(drop())
+
+
+async def explain(plan: AsyncEngine, case) -> list[tuple[str, list]]:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(plan.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with async_sessionmaker(plan, expire_on_commit=False)() as session:
+            await case(session)
+    finally:
+        event.remove(plan.sync_engine, "before_cursor_execute", capture)
+
+    plans = []
+    async with plan.connect() as conn:
+        for statement, parameters in statements:
+            if statement.lstrip().split()[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+                result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                explained = result.scalar()
+                if isinstance(explained, str):
+                    explained = json.loads(explained)
+                plans.append((statement, explained[0]["Plan"]))
+    return plans
+
+
+def seq_scans(node: dict) -> list[str]:
+    scans = []
+    if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+        scans.append(node["Relation Name"])
+    for child in node.get("Plans", []):
+        scans.extend(seq_scans(child))
+    return scans
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("case", CASES)
+async def test_no_seq_scan_on_large_tables(plan_engine, case, monkeypatch):
+    monkeypatch.setattr(config, "FEED_MODE", "push")
+    plans = await explain(plan_engine, CASES[case])
+
+    assert plans
+    for statement, plan in plans:
+        assert not seq_scans(plan), statement
@@ -0,0 +1,23 @@
+import sentry_sdk
+import config
+
+
+def traces_sampler(sampling_context: dict) -> float:
+    if sampling_context.get("parent_sampled") is not None:
+        return float(sampling_context["parent_sampled"])
+    path = sampling_context.get("asgi_scope", {}).get("path", "")
+    rules = [route for route in config.SENTRY_ROUTE_SAMPLE_RATES if path.startswith(route)]
+    if rules:
+        return config.SENTRY_ROUTE_SAMPLE_RATES[max(rules, key=len)]
+    return config.SENTRY_TRACES_SAMPLE_RATE
+
+
+def init_sentry():
+    if not config.SENTRY_DSN:
+        return
+    sentry_sdk.init(
+        dsn=config.SENTRY_DSN,
+        sample_rate=config.SENTRY_SAMPLE_RATE,
+        traces_sampler=traces_sampler,
+        profiles_sample_rate=config.SENTRY_PROFILES_SAMPLE_RATE,
+    )